@@ -33,6 +33,44 @@ DEVELOPER_USERNAME = "zxcegorka4"
 BASE_DIR = os.getenv("BASE_DIR", r"C:\Users\semen\telegram_bot")
 OBSHAYA_DIR = os.path.join(BASE_DIR, "Общая")
 
+# --- База данных ---
+# Сколько ждать снятия блокировки SQLite, прежде чем вернуть ошибку (мс)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Число потоков для читающих запросов (у каждого своё соединение)
+DB_READER_THREADS = int(os.getenv("DB_READER_THREADS", "4"))
+# Сколько пользователей держать в кэше ролей (db.py)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# Через сколько дней после прочтения письмо уходит в архив (0 — не архивировать)
+MAIL_RETENTION_DAYS = int(os.getenv("MAIL_RETENTION_DAYS", "180"))
+# Как часто запускать обслуживание БД (архив, ANALYZE, VACUUM, checkpoint), часы
+DB_MAINTENANCE_INTERVAL_HOURS = float(os.getenv("DB_MAINTENANCE_INTERVAL_HOURS", "24"))
+
+# --- Поиск ---
+# Как часто обходить BASE_DIR и обновлять индексы поиска (имена и текст документов), минуты
+INDEX_RESCAN_INTERVAL_MINUTES = float(os.getenv("INDEX_RESCAN_INTERVAL_MINUTES", "10"))
+# Следить за BASE_DIR через watchdog (если пакет установлен). По умолчанию выключено:
+# на сетевом диске inotify не видит изменений, сделанных с других компьютеров.
+FS_WATCH = os.getenv("FS_WATCH", "0") == "1"
+# Интервал страховочного обхода при включённом наблюдателе, минуты
+FS_WATCH_RESCAN_INTERVAL_MINUTES = float(os.getenv("FS_WATCH_RESCAN_INTERVAL_MINUTES", "60"))
+# Сколько последних поисковых запросов держать в кэше результатов
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+# Сколько лучших совпадений по именам хранить на запрос и сколько показывать на странице
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "100"))
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+# Файлы больше этого размера (МБ) в полнотекстовый индекс не разбираются
+DOC_INDEX_MAX_MB = int(os.getenv("DOC_INDEX_MAX_MB", "50"))
+# Сколько папок держать в кэше содержимого (dir_listing)
+DIR_CACHE_SIZE = int(os.getenv("DIR_CACHE_SIZE", "512"))
+# Сколько файлов и папок показывать на одной странице файлового браузера
+DIR_PAGE_SIZE = int(os.getenv("DIR_PAGE_SIZE", "20"))
+# Сколько коротких ID кнопок (short_ids) помнить на пользователя
+SHORT_IDS_PER_USER = int(os.getenv("SHORT_IDS_PER_USER", "1000"))
+
+# --- Интерфейс ---
+# Сколько писем показывать на одной странице списка
+MAIL_PAGE_SIZE = int(os.getenv("MAIL_PAGE_SIZE", "10"))
+
 # Создаём базовые директории, если не существуют
 def setup_directories():
     os.makedirs(BASE_DIR, exist_ok=True)
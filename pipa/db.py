@@ -1,74 +1,368 @@
 # db.py
 
 import os
+import logging
 import sqlite3
-from datetime import datetime
-from config import BASE_DIR
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from config import BASE_DIR, DB_BUSY_TIMEOUT_MS, USER_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
 
 DB_PATH = os.path.join(BASE_DIR, 'users.db')
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
-
-# ------------------ Создаём таблицы (если не существуют) ------------------
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    telegram_id INTEGER PRIMARY KEY,
-    name TEXT,
-    role TEXT,
-    username TEXT
-)
-''')
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS emails (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    recipient INTEGER,
-    subject TEXT,
-    body TEXT,
-    status TEXT,
-    attachment_file_id TEXT,
-    test_id INTEGER
-)
-''')
-conn.commit()
-
-try:
-    cursor.execute("ALTER TABLE emails ADD COLUMN test_id INTEGER")
-except sqlite3.OperationalError:
-    pass
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS tests (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    header TEXT,
-    test_link TEXT,
-    for_group INTEGER,
-    role TEXT,
-    user_id INTEGER,
-    attachment_file_id TEXT
-)
-''')
-conn.commit()
-
-try:
-    cursor.execute("ALTER TABLE tests ADD COLUMN attachment_file_id TEXT")
-except sqlite3.OperationalError:
-    pass
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS tests_results (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    telegram_id INTEGER,
-    username TEXT,
-    score INTEGER,
-    total INTEGER,
-    date TEXT
-)
-''')
-conn.commit()
+
+# ------------------ Соединения ------------------
+# Одно соединение на запись (под блокировкой) и по одному соединению
+# на чтение в каждом потоке. В режиме WAL читатели не ждут писателя,
+# а каждая операция получает собственный курсор, поэтому результаты
+# параллельных запросов не перемешиваются.
+
+def _connect(readonly: bool = False) -> sqlite3.Connection:
+    c = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    c.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}")
+    if readonly:
+        c.execute("PRAGMA query_only=ON")
+    else:
+        # Для новой базы сразу включаем инкрементальный VACUUM;
+        # существующую переводит run_maintenance().
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("PRAGMA synchronous=NORMAL")
+    return c
+
+_write_conn = _connect()
+_write_lock = threading.Lock()
+_local = threading.local()
+
+@contextmanager
+def _writer():
+    """
+    Курсор на соединении записи. Коммит при успешном выходе из блока,
+    откат при исключении.
+    """
+    with _write_lock:
+        cur = _write_conn.cursor()
+        try:
+            yield cur
+            _write_conn.commit()
+        except Exception:
+            _write_conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+@contextmanager
+def _reader():
+    """Курсор на соединении чтения текущего потока."""
+    rc = getattr(_local, "conn", None)
+    if rc is None:
+        rc = _local.conn = _connect(readonly=True)
+    cur = rc.cursor()
+    try:
+        yield cur
+    finally:
+        cur.close()
+
+# ------------------ Миграции схемы ------------------
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция
+# выполняется в своей транзакции вместе с повышением версии, поэтому
+# прерванный запуск не оставит базу в промежуточном состоянии.
+# Новые изменения схемы добавляются только в конец списка MIGRATIONS.
+
+def _add_column_if_missing(cur, table: str, column: str, decl: str):
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cur.fetchall()}:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _m001_base_schema(cur):
+    """Исходные таблицы (в том числе для баз, созданных до миграций)."""
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        telegram_id INTEGER PRIMARY KEY,
+        name TEXT,
+        role TEXT,
+        username TEXT
+    )
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS emails (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recipient INTEGER,
+        subject TEXT,
+        body TEXT,
+        status TEXT,
+        attachment_file_id TEXT,
+        test_id INTEGER
+    )
+    ''')
+    _add_column_if_missing(cur, "emails", "test_id", "INTEGER")
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS tests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        header TEXT,
+        test_link TEXT,
+        for_group INTEGER,
+        role TEXT,
+        user_id INTEGER,
+        attachment_file_id TEXT
+    )
+    ''')
+    _add_column_if_missing(cur, "tests", "attachment_file_id", "TEXT")
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS tests_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id INTEGER,
+        username TEXT,
+        score INTEGER,
+        total INTEGER,
+        date TEXT
+    )
+    ''')
+
+def _m002_lookup_indexes(cur):
+    """Индексы под почтовые ящики и поиск пользователей."""
+    # get_unread_emails / get_read_emails: recipient=? AND status=? с сортировкой по id
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_emails_recipient_status ON emails(recipient, status, id)")
+    # get_developer_id: lower(username)=?
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users(lower(username))")
+    # выборки пользователей по роли (рассылки группе)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)")
+
+def _m003_unread_counters(cur):
+    """
+    Счётчик непрочитанных писем по получателям. Поддерживается триггерами
+    в той же транзакции, что и insert_email / insert_emails_* /
+    mark_email_read / delete_email, поэтому не расходится с таблицей emails.
+    """
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS unread_counts (
+        recipient INTEGER PRIMARY KEY,
+        cnt INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    cur.execute("DELETE FROM unread_counts")
+    cur.execute("""
+        INSERT INTO unread_counts (recipient, cnt)
+        SELECT recipient, COUNT(*) FROM emails
+        WHERE status='unread' AND recipient IS NOT NULL
+        GROUP BY recipient
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_emails_unread_insert
+    AFTER INSERT ON emails WHEN NEW.status='unread'
+    BEGIN
+        INSERT INTO unread_counts (recipient, cnt) VALUES (NEW.recipient, 1)
+        ON CONFLICT(recipient) DO UPDATE SET cnt = cnt + 1;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_emails_unread_delete
+    AFTER DELETE ON emails WHEN OLD.status='unread'
+    BEGIN
+        UPDATE unread_counts SET cnt = cnt - 1 WHERE recipient = OLD.recipient;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_emails_unread_leave
+    AFTER UPDATE OF status, recipient ON emails WHEN OLD.status='unread'
+    BEGIN
+        UPDATE unread_counts SET cnt = cnt - 1 WHERE recipient = OLD.recipient;
+    END
+    """)
+    cur.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_emails_unread_enter
+    AFTER UPDATE OF status, recipient ON emails WHEN NEW.status='unread'
+    BEGIN
+        INSERT INTO unread_counts (recipient, cnt) VALUES (NEW.recipient, 1)
+        ON CONFLICT(recipient) DO UPDATE SET cnt = cnt + 1;
+    END
+    """)
+
+def _m004_mail_archive(cur):
+    """
+    Время прочтения письма и архив для старых прочитанных писем.
+    Уже прочитанные письма считаются прочитанными в момент миграции.
+    """
+    _add_column_if_missing(cur, "emails", "read_at", "TEXT")
+    cur.execute("UPDATE emails SET read_at=? WHERE status='read' AND read_at IS NULL",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_emails_status_read_at ON emails(status, read_at)")
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS emails_archive (
+        id INTEGER PRIMARY KEY,
+        recipient INTEGER,
+        subject TEXT,
+        body TEXT,
+        status TEXT,
+        attachment_file_id TEXT,
+        test_id INTEGER,
+        read_at TEXT,
+        archived_at TEXT
+    )
+    ''')
+
+def _m005_fs_index(cur):
+    """Индекс имён файлов и папок BASE_DIR для поиска (см. file_index.py)."""
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS fs_entries (
+        path TEXT PRIMARY KEY,
+        parent TEXT,
+        name TEXT,
+        kind TEXT
+    )
+    ''')
+
+def _create_docs_fts(cur) -> bool:
+    """
+    Создаёт полнотекстовую таблицу docs_fts. Если SQLite собран без FTS5,
+    пишет предупреждение и возвращает False — поиск по тексту отключается.
+    """
+    try:
+        cur.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+            path UNINDEXED,
+            name,
+            body,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        ''')
+        return True
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 недоступен, поиск по тексту документов отключён: {e}")
+        return False
+
+def _m006_docs_fts(cur):
+    """Текст документов для поиска по содержимому (см. doc_index.py)."""
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS docs_meta (
+        path TEXT PRIMARY KEY,
+        mtime REAL,
+        size INTEGER
+    )
+    ''')
+    _create_docs_fts(cur)
+
+def _m007_fs_signatures(cur):
+    """Подпись (mtime, размер, inode) записей fs_entries для инкрементального обхода."""
+    _add_column_if_missing(cur, "fs_entries", "mtime", "REAL")
+    _add_column_if_missing(cur, "fs_entries", "size", "INTEGER")
+    _add_column_if_missing(cur, "fs_entries", "inode", "INTEGER")
+
+def _m008_file_ids(cur):
+    """file_id документов, уже отправленных ботом, — чтобы не загружать их заново."""
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS file_ids (
+        path TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime REAL,
+        file_id TEXT,
+        file_unique_id TEXT
+    )
+    ''')
+
+def _m009_file_id_kind(cur):
+    """Тип файла в file_ids: document, photo или video (загрузки через админку)."""
+    _add_column_if_missing(cur, "file_ids", "kind", "TEXT DEFAULT 'document'")
+
+MIGRATIONS = [
+    _m001_base_schema,
+    _m002_lookup_indexes,
+    _m003_unread_counters,
+    _m004_mail_archive,
+    _m005_fs_index,
+    _m006_docs_fts,
+    _m007_fs_signatures,
+    _m008_file_ids,
+    _m009_file_id_kind,
+]
+
+def schema_version() -> int:
+    with _reader() as cur:
+        cur.execute("PRAGMA user_version")
+        return cur.fetchone()[0]
+
+def migrate():
+    """Применяет все миграции, которых ещё нет в базе."""
+    with _writer() as cur:
+        cur.execute("PRAGMA user_version")
+        current = cur.fetchone()[0]
+    if current > len(MIGRATIONS):
+        raise RuntimeError(
+            f"Схема БД (версия {current}) новее, чем поддерживает код ({len(MIGRATIONS)})."
+        )
+    for version, step in enumerate(MIGRATIONS[current:], start=current + 1):
+        with _writer() as cur:
+            cur.execute("BEGIN")
+            step(cur)
+            cur.execute(f"PRAGMA user_version={version}")
+    if current < len(MIGRATIONS):
+        with _writer() as cur:
+            cur.execute("PRAGMA optimize")
+
+migrate()
+
+def _init_fts() -> bool:
+    # Таблицы может не быть, если миграция шла на SQLite без FTS5 —
+    # тогда пробуем создать её снова (вдруг SQLite уже обновили).
+    with _writer() as cur:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE name='docs_fts'")
+        if cur.fetchone():
+            return True
+        return _create_docs_fts(cur)
+
+FTS_ENABLED = _init_fts()
+
+# ------------------ Кэш пользователей ------------------
+# Роль и данные пользователя нужны почти в каждом обработчике, поэтому
+# они кэшируются в памяти: telegram_id → строка users (или None, если
+# пользователя нет) и lower(username) → telegram_id. Кэш ограничен
+# USER_CACHE_SIZE записями (LRU) и сбрасывается при каждой записи в
+# users. Счётчик _user_cache_gen не даёт читателю положить в кэш строку,
+# прочитанную до параллельной записи.
+
+_MISS = object()
+_user_cache = OrderedDict()
+_username_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+_user_cache_gen = 0
+
+def _cache_get(cache: OrderedDict, key):
+    with _user_cache_lock:
+        value = cache.get(key, _MISS)
+        if value is not _MISS:
+            cache.move_to_end(key)
+        return value
+
+def _cache_put(cache: OrderedDict, key, value, gen: int):
+    with _user_cache_lock:
+        if gen != _user_cache_gen:
+            return
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > USER_CACHE_SIZE:
+            cache.popitem(last=False)
+
+def _invalidate_user(user_id: int, username: str | None = None):
+    global _user_cache_gen
+    with _user_cache_lock:
+        _user_cache_gen += 1
+        _user_cache.pop(user_id, None)
+        for uname in [k for k, v in _username_cache.items() if v == user_id]:
+            del _username_cache[uname]
+        if username:
+            _username_cache.pop(username.lower(), None)
+
+def peek_user(user_id: int):
+    """
+    Строка пользователя из кэша без обращения к БД.
+    Возвращает (True, row) при попадании и (False, None) при промахе.
+    """
+    row = _cache_get(_user_cache, user_id)
+    if row is _MISS:
+        return False, None
+    return True, row
 
 # ------------------ Функции для работы с таблицей users ------------------
 def get_user_by_id(user_id: int):
@@ -76,121 +370,518 @@ def get_user_by_id(user_id: int):
     Возвращает кортеж (telegram_id, name, role, username) или None,
     если пользователя нет в БД.
     """
-    cursor.execute("SELECT telegram_id, name, role, username FROM users WHERE telegram_id=?", (user_id,))
-    return cursor.fetchone()
+    row = _cache_get(_user_cache, user_id)
+    if row is not _MISS:
+        return row
+    gen = _user_cache_gen
+    with _reader() as cur:
+        cur.execute("SELECT telegram_id, name, role, username FROM users WHERE telegram_id=?", (user_id,))
+        row = cur.fetchone()
+    _cache_put(_user_cache, user_id, row, gen)
+    return row
 
 def get_all_users():
     """
     Возвращает список (telegram_id, name, username, role) для всех пользователей.
     """
-    cursor.execute("SELECT telegram_id, name, username, role FROM users")
-    return cursor.fetchall()
+    with _reader() as cur:
+        cur.execute("SELECT telegram_id, name, username, role FROM users")
+        return cur.fetchall()
 
 def create_user(user_id: int, name: str, username: str, role: str):
     """
     Создаёт (или обновляет) пользователя в таблице users.
     """
-    cursor.execute("""
-        INSERT OR REPLACE INTO users (telegram_id, name, username, role)
-        VALUES (?,?,?,?)
-    """, (user_id, name, username, role))
-    conn.commit()
+    with _writer() as cur:
+        cur.execute("""
+            INSERT OR REPLACE INTO users (telegram_id, name, username, role)
+            VALUES (?,?,?,?)
+        """, (user_id, name, username, role))
+    _invalidate_user(user_id, username)
 
 def update_user_role(user_id: int, role: str):
-    cursor.execute("UPDATE users SET role=? WHERE telegram_id=?", (role, user_id))
-    conn.commit()
+    with _writer() as cur:
+        cur.execute("UPDATE users SET role=? WHERE telegram_id=?", (role, user_id))
+    _invalidate_user(user_id)
 
 def delete_user(user_id: int):
     """
     Удаляет запись о пользователе (user_id) из таблицы users.
     """
-    cursor.execute("DELETE FROM users WHERE telegram_id=?", (user_id,))
-    conn.commit()
+    with _writer() as cur:
+        cur.execute("DELETE FROM users WHERE telegram_id=?", (user_id,))
+    _invalidate_user(user_id)
+
+def get_user_ids_by_role(role=None):
+    """
+    Возвращает список telegram_id пользователей роли role
+    (или всех пользователей, если role=None).
+    """
+    with _reader() as cur:
+        if role is None:
+            cur.execute("SELECT telegram_id FROM users")
+        else:
+            cur.execute("SELECT telegram_id FROM users WHERE role=?", (role,))
+        return [row[0] for row in cur.fetchall()]
 
 def get_role(user_id: int) -> str:
     """
     Возвращает строку role или пустую строку, если пользователя нет.
     """
-    cursor.execute("SELECT role FROM users WHERE telegram_id=?", (user_id,))
-    row = cursor.fetchone()
-    return row[0] if row else ""
+    row = get_user_by_id(user_id)
+    return (row[2] or "") if row else ""
 
 def get_developer_id(dev_username: str):
     """
     Возвращает telegram_id разработчика по его username,
     или None, если не найден.
     """
-    cursor.execute("SELECT telegram_id FROM users WHERE lower(username)=?", (dev_username.lower(),))
-    row = cursor.fetchone()
-    return row[0] if row else None
+    key = dev_username.lower()
+    dev_id = _cache_get(_username_cache, key)
+    if dev_id is not _MISS:
+        return dev_id
+    gen = _user_cache_gen
+    with _reader() as cur:
+        cur.execute("SELECT telegram_id FROM users WHERE lower(username)=?", (key,))
+        row = cur.fetchone()
+    dev_id = row[0] if row else None
+    _cache_put(_username_cache, key, dev_id, gen)
+    return dev_id
 
 # ------------------ Функции для таблицы emails ------------------
 def insert_email(recipient, subject, body, attachment, test_id=None):
-    cursor.execute("""
+    with _writer() as cur:
+        cur.execute("""
+            INSERT INTO emails (recipient, subject, body, status, attachment_file_id, test_id)
+            VALUES (?, ?, ?, 'unread', ?, ?)
+        """, (recipient, subject, body, attachment, test_id))
+
+def insert_emails_bulk(recipients, subject, body, attachment, test_id=None) -> int:
+    """
+    Одинаковое письмо списку получателей одной транзакцией.
+    Возвращает число созданных писем.
+    """
+    rows = [(rid, subject, body, attachment, test_id) for rid in recipients]
+    if not rows:
+        return 0
+    with _writer() as cur:
+        cur.executemany("""
+            INSERT INTO emails (recipient, subject, body, status, attachment_file_id, test_id)
+            VALUES (?, ?, ?, 'unread', ?, ?)
+        """, rows)
+    return len(rows)
+
+def insert_emails_for_role(role, subject, body, attachment, test_id=None) -> int:
+    """
+    Письмо всем пользователям роли role (или всем пользователям, если role=None)
+    одним запросом INSERT ... SELECT. Возвращает число созданных писем.
+    """
+    sql = """
         INSERT INTO emails (recipient, subject, body, status, attachment_file_id, test_id)
-        VALUES (?, ?, ?, 'unread', ?, ?)
-    """, (recipient, subject, body, attachment, test_id))
-    conn.commit()
-
-def get_unread_emails(user_id: int):
-    cursor.execute("""
-        SELECT id, subject, body, attachment_file_id, test_id
-        FROM emails
-        WHERE recipient=? AND status='unread'
-    """, (user_id,))
-    return cursor.fetchall()
-
-def get_read_emails(user_id: int):
-    cursor.execute("""
-        SELECT id, subject, body, attachment_file_id, test_id
-        FROM emails
-        WHERE recipient=? AND status='read'
-    """, (user_id,))
-    return cursor.fetchall()
+        SELECT telegram_id, ?, ?, 'unread', ?, ? FROM users
+    """
+    params = (subject, body, attachment, test_id)
+    if role is not None:
+        sql += " WHERE role=?"
+        params += (role,)
+    with _writer() as cur:
+        cur.execute(sql, params)
+        return cur.rowcount
+
+def _fetch_page(cur, sql: str, params, id_col: str, limit=None, before_id=None, after_id=None):
+    """
+    Keyset-пагинация для запроса, у которого уже есть WHERE.
+    before_id — страница старше (id < before_id), after_id — новее (id > after_id).
+    Строки всегда возвращаются от новых к старым.
+    """
+    params = list(params)
+    if before_id is not None:
+        sql += f" AND {id_col} < ?"
+        params.append(before_id)
+    if after_id is not None:
+        sql += f" AND {id_col} > ?"
+        params.append(after_id)
+    ascending = after_id is not None and before_id is None
+    sql += f" ORDER BY {id_col} {'ASC' if ascending else 'DESC'}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    if ascending:
+        rows.reverse()
+    return rows
+
+def get_unread_emails(user_id: int, limit=None, before_id=None, after_id=None):
+    """
+    Непрочитанные письма пользователя, новые сначала:
+    [(id, subject, body, attachment_file_id, test_id), ...].
+    """
+    with _reader() as cur:
+        return _fetch_page(cur, """
+            SELECT id, subject, body, attachment_file_id, test_id
+            FROM emails
+            WHERE recipient=? AND status='unread'
+        """, (user_id,), "id", limit, before_id, after_id)
+
+def get_read_emails(user_id: int, limit=None, before_id=None, after_id=None):
+    """
+    Прочитанные письма пользователя, новые сначала:
+    [(id, subject, body, attachment_file_id, test_id), ...].
+    """
+    with _reader() as cur:
+        return _fetch_page(cur, """
+            SELECT id, subject, body, attachment_file_id, test_id
+            FROM emails
+            WHERE recipient=? AND status='read'
+        """, (user_id,), "id", limit, before_id, after_id)
+
+def get_unread_count(user_id: int) -> int:
+    """
+    Число непрочитанных писем пользователя (из счётчика unread_counts).
+    """
+    with _reader() as cur:
+        cur.execute("SELECT cnt FROM unread_counts WHERE recipient=?", (user_id,))
+        row = cur.fetchone()
+    return row[0] if row else 0
 
 def mark_email_read(mail_id: int):
-    cursor.execute("UPDATE emails SET status='read' WHERE id=?", (mail_id,))
-    conn.commit()
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _writer() as cur:
+        cur.execute("UPDATE emails SET status='read', read_at=COALESCE(read_at, ?) WHERE id=?", (now, mail_id))
 
 def get_all_emails():
-    cursor.execute("""
-        SELECT id, recipient, subject, body, status, attachment_file_id, test_id
-        FROM emails
-    """)
-    return cursor.fetchall()
+    with _reader() as cur:
+        cur.execute("""
+            SELECT id, recipient, subject, body, status, attachment_file_id, test_id
+            FROM emails
+        """)
+        return cur.fetchall()
 
 def delete_email(mail_id: int):
-    cursor.execute("DELETE FROM emails WHERE id=?", (mail_id,))
-    conn.commit()
+    with _writer() as cur:
+        cur.execute("DELETE FROM emails WHERE id=?", (mail_id,))
+
+NO_ROLE = "Без роли"
+
+def count_emails_by_role():
+    """
+    Возвращает [(role, count), ...] — сколько писем у получателей каждой роли.
+    Получатели без роли (или удалённые из users) попадают в NO_ROLE.
+    """
+    with _reader() as cur:
+        cur.execute("""
+            SELECT COALESCE(NULLIF(u.role, ''), ?) AS r, COUNT(*)
+            FROM emails e
+            LEFT JOIN users u ON u.telegram_id = e.recipient
+            GROUP BY r
+            ORDER BY r
+        """, (NO_ROLE,))
+        return cur.fetchall()
+
+def get_emails_by_role(role: str, limit=None, before_id=None, after_id=None):
+    """
+    Письма получателей роли role, новые сначала:
+    [(id, recipient, subject, body, status, attachment_file_id, test_id), ...].
+    limit/before_id/after_id — постраничная выборка, как в get_unread_emails.
+    """
+    # emails всегда внешняя таблица: план идёт по e.id от новых к старым и для
+    # каждого письма проверяет роль по первичному ключу users, останавливаясь
+    # на limit, — без чтения и сортировки всей почты роли. Для роли это
+    # задаёт CROSS JOIN (SQLite не переставляет его), для «без роли» — LEFT JOIN.
+    select = """
+        SELECT e.id, e.recipient, e.subject, e.body, e.status, e.attachment_file_id, e.test_id
+        FROM emails e
+    """
+    if role == NO_ROLE:
+        sql = select + " LEFT JOIN users u ON u.telegram_id = e.recipient WHERE (u.role IS NULL OR u.role = '')"
+        params = []
+    else:
+        sql = select + " CROSS JOIN users u ON u.telegram_id = e.recipient WHERE u.role = ?"
+        params = [role]
+    with _reader() as cur:
+        return _fetch_page(cur, sql, params, "e.id", limit, before_id, after_id)
+
+def get_email_by_id(mail_id: int, recipient=None):
+    """
+    Возвращает письмо (id, recipient, subject, body, status, attachment_file_id, test_id)
+    или None. Если передан recipient, письмо возвращается только этому получателю.
+    """
+    with _reader() as cur:
+        if recipient is None:
+            cur.execute("""
+                SELECT id, recipient, subject, body, status, attachment_file_id, test_id
+                FROM emails WHERE id=?
+            """, (mail_id,))
+        else:
+            cur.execute("""
+                SELECT id, recipient, subject, body, status, attachment_file_id, test_id
+                FROM emails WHERE id=? AND recipient=?
+            """, (mail_id, recipient))
+        return cur.fetchone()
+
+def get_user_test_ids(user_id: int):
+    """
+    Возвращает id тестов, привязанных к письмам пользователя.
+    """
+    with _reader() as cur:
+        cur.execute("""
+            SELECT DISTINCT test_id FROM emails
+            WHERE recipient=? AND test_id IS NOT NULL
+        """, (user_id,))
+        return [row[0] for row in cur.fetchall()]
+
+def get_email_test_id(mail_id: int):
+    """
+    Возвращает test_id, привязанный к письму, или None.
+    """
+    with _reader() as cur:
+        cur.execute("SELECT test_id FROM emails WHERE id=?", (mail_id,))
+        row = cur.fetchone()
+    return row[0] if row else None
 
 # ------------------ Функции для таблицы tests ------------------
 def insert_test(header: str, test_link: str, for_group: bool, role=None, user_id=None, attachment_file_id=None):
     fg = 1 if for_group else 0
-    cursor.execute("""
-        INSERT INTO tests (header, test_link, for_group, role, user_id, attachment_file_id)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (header, test_link, fg, role, user_id, attachment_file_id))
-    conn.commit()
+    with _writer() as cur:
+        cur.execute("""
+            INSERT INTO tests (header, test_link, for_group, role, user_id, attachment_file_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (header, test_link, fg, role, user_id, attachment_file_id))
+        return cur.lastrowid
 
 def get_all_tests():
-    cursor.execute("""
-        SELECT id, header, test_link, for_group, role, user_id, attachment_file_id
-        FROM tests
-    """)
-    return cursor.fetchall()
+    with _reader() as cur:
+        cur.execute("""
+            SELECT id, header, test_link, for_group, role, user_id, attachment_file_id
+            FROM tests
+        """)
+        return cur.fetchall()
+
+def get_test_by_id(test_id: int):
+    """
+    Возвращает тест (id, header, test_link, for_group, role, user_id, attachment_file_id)
+    или None.
+    """
+    with _reader() as cur:
+        cur.execute("""
+            SELECT id, header, test_link, for_group, role, user_id, attachment_file_id
+            FROM tests WHERE id=?
+        """, (test_id,))
+        return cur.fetchone()
+
+def get_tests_by_ids(test_ids):
+    """
+    Возвращает тесты с указанными id (в порядке id).
+    """
+    ids = list(test_ids)
+    result = []
+    with _reader() as cur:
+        # Не больше 500 параметров на запрос — ниже лимита SQLite на переменные.
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            cur.execute(f"""
+                SELECT id, header, test_link, for_group, role, user_id, attachment_file_id
+                FROM tests WHERE id IN ({marks})
+            """, chunk)
+            result.extend(cur.fetchall())
+    result.sort(key=lambda t: t[0])
+    return result
+
+def delete_test(test_id: int):
+    with _writer() as cur:
+        cur.execute("DELETE FROM tests WHERE id=?", (test_id,))
 
 def save_test_result(user_id: int, username: str, score: int, total: int):
     date_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute("""
-        INSERT INTO tests_results (telegram_id, username, score, total, date)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user_id, username, score, total, date_str))
-    conn.commit()
+    with _writer() as cur:
+        cur.execute("""
+            INSERT INTO tests_results (telegram_id, username, score, total, date)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, username, score, total, date_str))
 
 def get_all_test_results():
-    cursor.execute("""
-        SELECT telegram_id, username, score, total, date
-        FROM tests_results
-        ORDER BY id DESC
-    """)
-    return cursor.fetchall()
+    with _reader() as cur:
+        cur.execute("""
+            SELECT telegram_id, username, score, total, date
+            FROM tests_results
+            ORDER BY id DESC
+        """)
+        return cur.fetchall()
+
+# ------------------ Индекс файлов (fs_entries) ------------------
+# path — путь относительно BASE_DIR, parent — как os.path.relpath(папки, BASE_DIR)
+# ("." для корня), kind — "file" или "dir"; mtime, size, inode — подпись,
+# по которой обход диска понимает, что запись изменилась.
+
+def get_fs_entries():
+    """Возвращает [(path, parent, name, kind, mtime, size, inode), ...] для всего индекса."""
+    with _reader() as cur:
+        cur.execute("SELECT path, parent, name, kind, mtime, size, inode FROM fs_entries")
+        return cur.fetchall()
+
+def apply_fs_changes(upserts, deleted_paths):
+    """
+    Одной транзакцией добавляет/обновляет строки (path, parent, name, kind,
+    mtime, size, inode) и удаляет записи с путями из deleted_paths.
+    """
+    with _writer() as cur:
+        cur.executemany(
+            "INSERT OR REPLACE INTO fs_entries (path, parent, name, kind, mtime, size, inode) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            upserts
+        )
+        cur.executemany("DELETE FROM fs_entries WHERE path=?", [(p,) for p in deleted_paths])
+
+def delete_fs_entries(paths):
+    """Удаляет записи paths и всё, что лежит внутри них (для папок), в одной транзакции."""
+    with _writer() as cur:
+        for path in paths:
+            prefix = path + os.sep
+            # Диапазон [prefix, prefix с «следующим» разделителем) — все пути внутри папки
+            upper = path + chr(ord(os.sep) + 1)
+            cur.execute("DELETE FROM fs_entries WHERE path=? OR (path >= ? AND path < ?)", (path, prefix, upper))
+
+# ------------------ Текст документов (docs_fts, docs_meta) ------------------
+# docs_meta хранит mtime и размер проиндексированной версии файла, чтобы
+# повторно разбирать только изменившиеся документы.
+
+def get_docs_meta() -> dict:
+    """Возвращает {path: (mtime, size)} для всех проиндексированных документов."""
+    with _reader() as cur:
+        cur.execute("SELECT path, mtime, size FROM docs_meta")
+        return {path: (mtime, size) for path, mtime, size in cur.fetchall()}
+
+def upsert_doc(path: str, name: str, body: str, mtime: float, size: int):
+    """Заменяет текст документа path в полнотекстовом индексе."""
+    with _writer() as cur:
+        if FTS_ENABLED:
+            cur.execute("DELETE FROM docs_fts WHERE path=?", (path,))
+            cur.execute("INSERT INTO docs_fts (path, name, body) VALUES (?, ?, ?)", (path, name, body))
+        cur.execute("INSERT OR REPLACE INTO docs_meta (path, mtime, size) VALUES (?, ?, ?)", (path, mtime, size))
+
+def delete_docs(paths):
+    """Убирает документы из полнотекстового индекса."""
+    rows = [(p,) for p in paths]
+    with _writer() as cur:
+        if FTS_ENABLED:
+            cur.executemany("DELETE FROM docs_fts WHERE path=?", rows)
+        cur.executemany("DELETE FROM docs_meta WHERE path=?", rows)
+
+def search_docs(match: str, prefixes=None, limit: int = 5):
+    """
+    Ищет документы по выражению FTS5 match, лучшие по BM25 — первыми.
+    prefixes — папки (пути от BASE_DIR), которыми ограничен поиск; None — везде.
+    Возвращает [(path, name, snippet), ...].
+    """
+    if not FTS_ENABLED:
+        return []
+    sql = (
+        "SELECT path, name, snippet(docs_fts, 2, '«', '»', '…', 12) "
+        "FROM docs_fts WHERE docs_fts MATCH ?"
+    )
+    params = [match]
+    if prefixes is not None:
+        ranges = []
+        for p in prefixes:
+            ranges.append("(path >= ? AND path < ?)")
+            params += [p + os.sep, p + chr(ord(os.sep) + 1)]
+        sql += " AND (" + " OR ".join(ranges) + ")"
+    # Совпадение в имени файла весит вдвое больше, чем в тексте
+    sql += " ORDER BY bm25(docs_fts, 0.0, 2.0, 1.0) LIMIT ?"
+    params.append(limit)
+    with _reader() as cur:
+        try:
+            cur.execute(sql, params)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Некорректный запрос к docs_fts {match!r}: {e}")
+            return []
+        return cur.fetchall()
+
+# ------------------ file_id отправленных файлов ------------------
+# file_id действителен для той версии файла, с которой он получен: вместе
+# с ним хранятся размер и mtime, и при их расхождении запись не используется.
+
+def save_file_id(path: str, size: int, mtime: float, file_id: str, file_unique_id: str, kind: str = "document"):
+    with _writer() as cur:
+        cur.execute(
+            "INSERT OR REPLACE INTO file_ids (path, size, mtime, file_id, file_unique_id, kind) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (path, size, mtime, file_id, file_unique_id, kind)
+        )
+
+def get_file_ids(paths) -> dict:
+    """Возвращает {path: (size, mtime, file_id, kind)} для известных путей."""
+    paths = list(paths)
+    result = {}
+    with _reader() as cur:
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            cur.execute(f"SELECT path, size, mtime, file_id, kind FROM file_ids WHERE path IN ({marks})", chunk)
+            for path, size, mtime, file_id, kind in cur.fetchall():
+                result[path] = (size, mtime, file_id, kind or "document")
+    return result
+
+def delete_file_ids(paths):
+    with _writer() as cur:
+        cur.executemany("DELETE FROM file_ids WHERE path=?", [(p,) for p in paths])
+
+# ------------------ Архивирование и обслуживание ------------------
+def archive_read_emails(older_than_days: int, batch_size: int = 1000) -> int:
+    """
+    Переносит в emails_archive письма, прочитанные раньше, чем older_than_days дней назад.
+    Письма с тестом остаются в emails: по ним сотрудник находит свои тесты
+    (get_user_test_ids, get_email_test_id). Работает пачками по batch_size
+    писем в отдельных транзакциях, чтобы не держать блокировку записи долго.
+    Возвращает число перенесённых писем.
+    """
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    moved = 0
+    while True:
+        with _writer() as cur:
+            cur.execute("""
+                SELECT id FROM emails
+                WHERE status='read' AND read_at < ? AND test_id IS NULL
+                ORDER BY id LIMIT ?
+            """, (cutoff, batch_size))
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
+            marks = ",".join("?" * len(ids))
+            cur.execute(f"""
+                INSERT OR REPLACE INTO emails_archive
+                    (id, recipient, subject, body, status, attachment_file_id, test_id, read_at, archived_at)
+                SELECT id, recipient, subject, body, status, attachment_file_id, test_id, read_at, ?
+                FROM emails WHERE id IN ({marks})
+            """, [now] + ids)
+            cur.execute(f"DELETE FROM emails WHERE id IN ({marks})", ids)
+        moved += len(ids)
+    return moved
+
+def run_maintenance(vacuum_pages: int = 2000) -> dict:
+    """
+    Плановое обслуживание базы: статистика планировщика (ANALYZE),
+    возврат свободных страниц (incremental VACUUM) и сброс WAL в основной файл.
+    Возвращает сводку для логов.
+    """
+    result = {}
+    with _writer() as cur:
+        cur.execute("PRAGMA auto_vacuum")
+        if cur.fetchone()[0] != 2:
+            # База создана до перехода на INCREMENTAL — один раз перестраиваем её.
+            cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            cur.execute("VACUUM")
+            result["full_vacuum"] = True
+        cur.execute("ANALYZE")
+        cur.execute("PRAGMA freelist_count")
+        result["free_pages_before"] = cur.fetchone()[0]
+        # executescript доводит PRAGMA до конца (execute освобождает лишь одну страницу за шаг)
+        cur.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)});")
+        cur.execute("PRAGMA freelist_count")
+        result["free_pages_after"] = cur.fetchone()[0]
+        cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        result["wal_checkpoint"] = cur.fetchone()
+    return result
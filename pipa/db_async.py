@@ -0,0 +1,112 @@
+# db_async.py
+
+"""
+Асинхронные обёртки над функциями db.py.
+
+Все запросы к SQLite выполняются вне цикла событий, поэтому медленный
+диск или ожидание блокировки не останавливают бота. Запись идёт через
+один поток (у SQLite всё равно один писатель), чтение — через пул
+потоков, каждый со своим соединением. Сигнатуры совпадают с db.py,
+только функции нужно вызывать через await.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+from db import NO_ROLE  # noqa: F401 (реэкспорт для обработчиков)
+from config import DB_READER_THREADS
+
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+_read_executor = ThreadPoolExecutor(max_workers=DB_READER_THREADS, thread_name_prefix="db-read")
+
+
+def _run_in(executor):
+    """Превращает синхронную функцию db.py в корутину, исполняемую в executor."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+        return wrapper
+    return decorator
+
+_read = _run_in(_read_executor)
+_write = _run_in(_write_executor)
+
+
+def shutdown():
+    """Дожидается завершения запросов в очереди и останавливает потоки БД."""
+    _write_executor.shutdown(wait=True)
+    _read_executor.shutdown(wait=True)
+
+
+# ------------------ users ------------------
+_get_user_by_id = _read(db.get_user_by_id)
+
+
+async def get_user_by_id(user_id: int):
+    # Попадание в кэш пользователей отдаём сразу, без перехода в поток БД.
+    found, row = db.peek_user(user_id)
+    if found:
+        return row
+    return await _get_user_by_id(user_id)
+
+
+async def get_role(user_id: int) -> str:
+    row = await get_user_by_id(user_id)
+    return (row[2] or "") if row else ""
+
+
+get_all_users = _read(db.get_all_users)
+create_user = _write(db.create_user)
+update_user_role = _write(db.update_user_role)
+delete_user = _write(db.delete_user)
+get_user_ids_by_role = _read(db.get_user_ids_by_role)
+get_developer_id = _read(db.get_developer_id)
+
+# ------------------ emails ------------------
+insert_email = _write(db.insert_email)
+insert_emails_bulk = _write(db.insert_emails_bulk)
+insert_emails_for_role = _write(db.insert_emails_for_role)
+get_unread_emails = _read(db.get_unread_emails)
+get_read_emails = _read(db.get_read_emails)
+get_unread_count = _read(db.get_unread_count)
+mark_email_read = _write(db.mark_email_read)
+get_all_emails = _read(db.get_all_emails)
+delete_email = _write(db.delete_email)
+count_emails_by_role = _read(db.count_emails_by_role)
+get_emails_by_role = _read(db.get_emails_by_role)
+get_email_by_id = _read(db.get_email_by_id)
+get_user_test_ids = _read(db.get_user_test_ids)
+get_email_test_id = _read(db.get_email_test_id)
+
+# ------------------ tests ------------------
+insert_test = _write(db.insert_test)
+get_all_tests = _read(db.get_all_tests)
+get_test_by_id = _read(db.get_test_by_id)
+get_tests_by_ids = _read(db.get_tests_by_ids)
+delete_test = _write(db.delete_test)
+save_test_result = _write(db.save_test_result)
+get_all_test_results = _read(db.get_all_test_results)
+
+# ------------------ индекс файлов ------------------
+get_fs_entries = _read(db.get_fs_entries)
+apply_fs_changes = _write(db.apply_fs_changes)
+delete_fs_entries = _write(db.delete_fs_entries)
+
+# ------------------ текст документов ------------------
+get_docs_meta = _read(db.get_docs_meta)
+upsert_doc = _write(db.upsert_doc)
+delete_docs = _write(db.delete_docs)
+search_docs = _read(db.search_docs)
+
+# ------------------ file_id отправленных файлов ------------------
+save_file_id = _write(db.save_file_id)
+get_file_ids = _read(db.get_file_ids)
+delete_file_ids = _write(db.delete_file_ids)
+
+# ------------------ обслуживание ------------------
+archive_read_emails = _write(db.archive_read_emails)
+run_maintenance = _write(db.run_maintenance)
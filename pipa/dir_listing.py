@@ -0,0 +1,142 @@
+# dir_listing.py
+
+"""
+Содержимое папок для файловых браузеров (handlers/files.py и админка).
+
+Папка читается через os.scandir: тип записи берётся из самого каталога
+(d_type), без отдельного stat на каждый элемент (stat нужен только для
+сортировки по дате). Отсортированный список кэшируется и считается
+актуальным, пока не изменился mtime папки, — повторное открытие и
+листание страниц стоят одного stat и среза. Правка файла на месте mtime
+папки не меняет, поэтому порядок по дате живёт не дольше DATE_ORDER_TTL
+секунд — этого хватает, чтобы листать страницы без повторного обхода.
+Холодное чтение идёт в отдельном потоке, чтобы большая папка на сетевом
+диске не останавливала цикл событий. Код бота и файлы БД в корне
+BASE_DIR не показываются.
+
+Изменения, сделанные ботом и замеченные наблюдателем (fs_watch),
+сбрасывают кэш явно через invalidate().
+"""
+
+import asyncio
+import os
+import stat
+import time
+from collections import OrderedDict
+
+import file_index
+from config import BASE_DIR, DIR_CACHE_SIZE
+
+# Порядок сортировки: по имени или по дате изменения (новые сверху)
+ORDERS = ("name", "date")
+
+# Сколько секунд доверять кэшированному порядку по дате
+DATE_ORDER_TTL = 30
+
+# rel_path -> (mtime_ns папки, {order: (((name, is_dir), ...), время построения)})
+_cache = OrderedDict()
+
+
+def _key(rel_path: str) -> str:
+    return os.path.normpath(rel_path)
+
+
+def _scan(full_path: str, key: str, with_dates: bool):
+    rows = []
+    with os.scandir(full_path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+                if not is_dir and not entry.is_file():
+                    continue
+                if key == "." and file_index.is_ignored(entry.name):
+                    continue
+                mtime = entry.stat().st_mtime_ns if with_dates else 0
+            except OSError:
+                continue
+            rows.append((entry.name, is_dir, mtime))
+    return rows
+
+
+def _ordered(rows, order: str):
+    # Папки всегда идут перед файлами
+    if order == "date":
+        rows = sorted(rows, key=lambda r: (not r[1], -r[2], r[0]))
+    else:
+        rows = sorted(rows, key=lambda r: (not r[1], r[0]))
+    return tuple((name, is_dir) for name, is_dir, _ in rows)
+
+
+async def list_dir(rel_path: str, order: str = "name"):
+    """
+    Возвращает ((name, is_dir), ...) — сначала папки, затем файлы, в порядке
+    order, — или None, если папки BASE_DIR/rel_path нет.
+    Ошибки чтения самой папки (OSError) передаются вызывающему.
+    """
+    if order not in ORDERS:
+        order = "name"
+    key = _key(rel_path)
+    full_path = os.path.join(BASE_DIR, key)
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        _cache.pop(key, None)
+        return None
+    if not stat.S_ISDIR(st.st_mode):
+        return None
+
+    cached = _cache.get(key)
+    if cached and cached[0] == st.st_mtime_ns:
+        _cache.move_to_end(key)
+        hit = cached[1].get(order)
+        if hit and (order != "date" or time.monotonic() - hit[1] < DATE_ORDER_TTL):
+            return hit[0]
+        orders = cached[1]
+    else:
+        orders = {}
+
+    rows = await asyncio.to_thread(_scan, full_path, key, order == "date")
+    entries = _ordered(rows, order)
+    # Папку, изменённую только что, не кэшируем: следующее изменение в ту же
+    # секунду может не сдвинуть mtime (грубые отметки времени на сетевых дисках)
+    if time.time_ns() - st.st_mtime_ns > 2_000_000_000:
+        orders[order] = (entries, time.monotonic())
+        _cache[key] = (st.st_mtime_ns, orders)
+        _cache.move_to_end(key)
+        while len(_cache) > DIR_CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.pop(key, None)
+    return entries
+
+
+def page_of(entries, page: int, size: int):
+    """Возвращает (срез entries для страницы, номер страницы, число страниц)."""
+    pages = max(1, (len(entries) + size - 1) // size)
+    page = min(max(page, 0), pages - 1)
+    return entries[page * size:(page + 1) * size], page, pages
+
+
+def invalidate_many(rel_paths):
+    """
+    Сбрасывает кэш для путей (от BASE_DIR), их родительских папок и всего,
+    что лежит внутри них (удалённая или перенесённая папка).
+    """
+    keys = {_key(p) for p in rel_paths}
+    if not keys:
+        return
+    drop = keys | {os.path.dirname(k) or "." for k in keys}
+    for k in list(_cache):
+        if k in drop:
+            del _cache[k]
+            continue
+        parent = os.path.dirname(k)
+        while parent and parent not in keys:
+            parent = os.path.dirname(parent)
+        if parent:
+            del _cache[k]
+
+
+def invalidate(rel_path: str):
+    """Сбрасывает кэш для пути и его родительской папки (путь от BASE_DIR)."""
+    invalidate_many([rel_path])
@@ -0,0 +1,98 @@
+# doc_index.py
+
+"""
+Полнотекстовый индекс содержимого документов (таблица docs_fts, FTS5).
+
+sync() сверяет подписи (mtime, размер) .docx/.doc из индекса имён
+(file_index) с docs_meta и заново разбирает только изменившиеся файлы;
+пропавшие убираются. Синхронизация идёт после каждого обхода диска
+(jobs.index_rescan_job) в отдельном потоке, сам диск она не обходит.
+search() ищет документы по словам запроса с ранжированием BM25 и
+возвращает фрагменты текста вокруг найденного.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import db
+import db_async
+import doc_text
+import file_index
+from config import BASE_DIR, DOC_INDEX_MAX_MB
+
+logger = logging.getLogger(__name__)
+
+_sync_lock = threading.Lock()
+
+# Итоги последней синхронизации (для статистики в админ-панели)
+last_sync = {}
+# Номер версии индекса: растёт, когда sync() что-то поменял
+_gen = 0
+
+
+def enabled() -> bool:
+    return db.FTS_ENABLED
+
+
+def generation() -> int:
+    return _gen
+
+
+def sync() -> dict:
+    """Досканирует изменённые документы. Вызывать не из цикла событий."""
+    if not enabled():
+        return {}
+    global _gen
+    if not _sync_lock.acquire(blocking=False):
+        return {}
+    started = time.monotonic()
+    try:
+        meta = db.get_docs_meta()
+        max_size = DOC_INDEX_MAX_MB * 1024 * 1024
+        seen = set()
+        indexed = 0
+        for path, name, mtime, size in file_index.files_with_signatures():
+            if not doc_text.supported(name.lower()):
+                continue
+            seen.add(path)
+            # size=None — запись из старой базы, которую обход ещё не подписал
+            if size is None or meta.get(path) == (mtime, size):
+                continue
+            # Неразобранный или слишком большой файл тоже запоминаем (с пустым
+            # текстом), чтобы не пытаться снова, пока он не изменится.
+            full = os.path.join(BASE_DIR, path)
+            body = doc_text.extract_text(full) if size <= max_size else ""
+            db.upsert_doc(path, name, body, mtime, size)
+            indexed += 1
+        gone = [p for p in meta if p not in seen]
+        if gone:
+            db.delete_docs(gone)
+        if indexed or gone:
+            _gen += 1
+        stats = {
+            "finished": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "duration": round(time.monotonic() - started, 2),
+            "total": len(seen),
+            "indexed": indexed,
+            "removed": len(gone),
+        }
+        last_sync.clear()
+        last_sync.update(stats)
+        return stats
+    finally:
+        _sync_lock.release()
+
+
+def build_match(tokens) -> str:
+    """Слова запроса → выражение FTS5: все слова обязательны, с поиском по префиксу."""
+    return " ".join('"' + t.replace('"', '""') + '"*' for t in tokens)
+
+
+async def search(tokens, prefixes=None, limit: int = 5):
+    """Возвращает [(path, name, snippet), ...] лучших по BM25 документов."""
+    if not enabled() or not tokens:
+        return []
+    return await db_async.search_docs(build_match(tokens), prefixes, limit)
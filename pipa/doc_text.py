@@ -0,0 +1,84 @@
+# doc_text.py
+
+"""
+Извлечение текста из документов для полнотекстового поиска.
+
+.docx — это zip-архив с word/document.xml: берём текст абзацев из XML.
+У старого двоичного .doc формата много вариантов, поэтому разбираем его
+«на глаз»: вытаскиваем из файла длинные участки текста в UTF-16LE (так
+Word хранит кириллицу). Форматирование и служебные поля теряются, но для
+поиска по фразам этого достаточно.
+"""
+
+import logging
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".docx", ".doc")
+
+# Ограничение на объём текста одного документа (символы)
+MAX_TEXT_CHARS = 2_000_000
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# Участки UTF-16LE: латиница/знаки (байт, 0x00), кириллица (байт, 0x04),
+# табуляция и перевод строки. Короткие куски — как правило, мусор.
+_UTF16_RUN = re.compile(rb"(?:[\x20-\x7e]\x00|[\x00-\xff]\x04|[\t\r\n]\x00){8,}")
+
+
+def supported(name_lower: str) -> bool:
+    # "~$имя.docx" — файл блокировки Word, а не документ
+    return name_lower.endswith(SUPPORTED_EXTENSIONS) and not name_lower.startswith("~$")
+
+
+def _docx_text(path: str) -> str:
+    parts = []
+    size = 0
+    with zipfile.ZipFile(path) as zf:
+        with zf.open("word/document.xml") as xml:
+            for _, el in ET.iterparse(xml, events=("end",)):
+                tag = el.tag
+                if tag == _W + "t":
+                    if el.text:
+                        parts.append(el.text)
+                        size += len(el.text)
+                elif tag == _W + "tab":
+                    parts.append(" ")
+                elif tag in (_W + "br", _W + "cr", _W + "p"):
+                    parts.append("\n")
+                    if tag == _W + "p":
+                        el.clear()
+                if size > MAX_TEXT_CHARS:
+                    break
+    return "".join(parts)
+
+
+def _doc_text(path: str) -> str:
+    with open(path, "rb") as f:
+        data = f.read()
+    runs = []
+    size = 0
+    for m in _UTF16_RUN.finditer(data):
+        text = m.group().decode("utf-16-le", errors="ignore").strip()
+        if text:
+            runs.append(text)
+            size += len(text)
+            if size > MAX_TEXT_CHARS:
+                break
+    return "\n".join(runs)
+
+
+def extract_text(path: str) -> str:
+    """Возвращает текст документа или пустую строку, если его не удалось разобрать."""
+    lower = path.lower()
+    try:
+        if lower.endswith(".docx"):
+            return _docx_text(path)[:MAX_TEXT_CHARS]
+        if lower.endswith(".doc"):
+            return _doc_text(path)[:MAX_TEXT_CHARS]
+    except Exception as e:
+        logger.warning(f"Не удалось извлечь текст из {path}: {e}")
+    return ""
@@ -0,0 +1,97 @@
+# file_ids.py
+
+"""
+Telegram file_id для файлов из BASE_DIR.
+
+После того как бот один раз отправил документ, Telegram хранит его у себя,
+и по file_id его можно переслать без повторной загрузки (а в инлайн-режиме
+иначе и нельзя). Для файлов, загруженных через админку, file_id известен
+сразу — его сохраняет store() в момент загрузки. file_id привязан к
+версии файла: вместе с ним хранятся размер и mtime, и если файл
+изменился, старый file_id не используется.
+
+send_cached_document() — единая точка отправки файлов пользователям:
+повторная отправка того же файла — один короткий запрос к API без
+чтения с диска и без загрузки.
+"""
+
+import logging
+import os
+
+from telegram.error import BadRequest
+
+import db_async
+from config import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+async def store(rel_path: str, file_id: str, file_unique_id: str, kind: str = "document", st=None):
+    """
+    Запоминает file_id (kind: document, photo или video) для файла rel_path.
+    st — os.stat файла на момент получения file_id (иначе берётся текущий).
+    """
+    rel_path = os.path.normpath(rel_path)
+    try:
+        st = st or os.stat(os.path.join(BASE_DIR, rel_path))
+        await db_async.save_file_id(rel_path, st.st_size, st.st_mtime, file_id, file_unique_id, kind)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить file_id для {rel_path}: {e}")
+
+
+async def remember(rel_path: str, message, st=None):
+    """Запоминает file_id документа из отправленного ботом сообщения."""
+    doc = getattr(message, "document", None)
+    if doc:
+        await store(rel_path, doc.file_id, doc.file_unique_id, "document", st)
+
+
+async def send_cached_document(bot, chat_id: int, rel_path: str, filename: str | None = None):
+    """
+    Отправляет файл BASE_DIR/rel_path в чат. Если для этой версии файла
+    уже есть file_id — отправляет по нему (фото и видео, загруженные через
+    админку, — как фото и видео), иначе загружает файл документом и
+    запоминает полученный file_id. Возвращает отправленное сообщение.
+    """
+    rel_path = os.path.normpath(rel_path)
+    full_path = os.path.join(BASE_DIR, rel_path)
+    filename = filename or os.path.basename(rel_path)
+    st = os.stat(full_path)
+
+    known = await db_async.get_file_ids([rel_path])
+    row = known.get(rel_path)
+    if row and row[0] == st.st_size and row[1] == st.st_mtime:
+        file_id, kind = row[2], row[3]
+        try:
+            if kind == "photo":
+                return await bot.send_photo(chat_id=chat_id, photo=file_id)
+            if kind == "video":
+                return await bot.send_video(chat_id=chat_id, video=file_id)
+            return await bot.send_document(chat_id=chat_id, document=file_id)
+        except BadRequest as e:
+            # file_id мог стать недействительным (например, бот пересоздан) — загружаем заново
+            logger.warning(f"file_id для {rel_path} не принят ({e}), отправляем файл заново")
+            await db_async.delete_file_ids([rel_path])
+
+    with open(full_path, "rb") as f:
+        msg = await bot.send_document(chat_id=chat_id, document=f, filename=filename)
+    await remember(rel_path, msg, st)
+    return msg
+
+
+async def lookup(files) -> dict:
+    """
+    files — [(path, mtime, size), ...] с текущими подписями файлов.
+    Возвращает {path: (file_id, kind)} только для файлов, не менявшихся
+    с получения file_id.
+    """
+    files = list(files)
+    if not files:
+        return {}
+    known = await db_async.get_file_ids(p for p, _, _ in files)
+    result = {}
+    for path, mtime, size in files:
+        row = known.get(path)
+        if row and row[0] == size and row[1] == mtime:
+            result[path] = (row[2], row[3])
+    return result
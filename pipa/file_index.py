@@ -0,0 +1,526 @@
+# file_index.py
+
+"""
+Индекс имён файлов и папок внутри BASE_DIR для поиска.
+
+Индекс держится в памяти и дублируется в таблице fs_entries, чтобы после
+перезапуска поиск работал сразу, не дожидаясь обхода диска. Для каждой
+записи хранится «подпись» (mtime, размер, inode). Файлы попадают в
+BASE_DIR и мимо бота (их копируют по сети), поэтому периодическая задача
+вызывает rescan(): обход дерева через os.scandir в отдельном потоке,
+сравнение подписей с индексом и запись только изменившихся строк.
+Между обходами индекс обновляется точечно: файловый менеджер админки
+вызывает note_added / note_removed после загрузки и удаления.
+
+Индекс разбит на разделы по верхней папке (роль — по правилам
+get_top_role_folder, «Общая» и прочие — по имени папки). Поиск
+сотрудника затрагивает только разделы его роли и «Общей», так что рост
+папок других отделов на него не влияет.
+
+Все пути — относительно BASE_DIR, как их возвращает os.path.relpath.
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import re
+import stat
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import db
+import db_async
+from config import BASE_DIR
+from paths import get_top_role_folder
+
+logger = logging.getLogger(__name__)
+
+# Служебное содержимое корня BASE_DIR, которое не показываем в поиске
+# (папка с кодом бота — её же скрывает файловый менеджер — и файлы БД).
+_SKIP_TOP_DIRS = {"pipa"}
+_SKIP_TOP_FILE_PREFIX = os.path.basename(db.DB_PATH)
+
+# Записи хранятся по числовым id: path -> id, id -> запись/путь/подпись.
+# Удалённые id не переиспользуются (в _items остаётся None); когда их
+# становится больше, чем живых, структуры пересобираются (_compact).
+_ids = {}
+_items = []   # id -> (kind, parent, name, name_lower) или None
+_paths = []   # id -> path
+_sigs = []    # id -> (mtime, size, inode)
+_lock = threading.Lock()
+# Номер версии всего индекса: растёт при каждом изменении
+_gen = 0
+
+
+class _Partition:
+    """Раздел индекса: живые id, кэш представления для поиска и слова имён."""
+    __slots__ = ("ids", "gen", "view", "words")
+
+    def __init__(self):
+        self.ids = set()
+        self.gen = 0                        # растёт при изменении раздела
+        self.view = None                    # (gen, entries, names_lower)
+        self.words = []                     # отсортированный [(слово, id), ...] имён файлов
+
+
+# имя раздела -> _Partition (см. partition_of)
+_parts = defaultdict(_Partition)
+# Пути, изменённые через note_added/note_removed во время обхода диска:
+# rescan() их не трогает, чтобы не откатить более свежие данные.
+_touched = None
+_scan_lock = threading.Lock()
+
+# Итоги последнего обхода (для статистики в админ-панели)
+last_scan = {}
+
+
+def _row(path: str, kind: str, st):
+    parent, name = os.path.split(path)
+    return (path, parent or ".", name, kind, st.st_mtime, st.st_size, st.st_ino)
+
+
+def _skipped(parent: str, name: str, kind: str) -> bool:
+    if parent != ".":
+        return False
+    if kind == "dir":
+        return name.lower() in _SKIP_TOP_DIRS
+    return name.startswith(_SKIP_TOP_FILE_PREFIX)
+
+
+def is_ignored(rel_path: str) -> bool:
+    """True для путей, которые индекс не хранит (код бота, файлы БД)."""
+    parts = os.path.normpath(rel_path).split(os.sep)
+    if len(parts) > 1:
+        return _skipped(".", parts[0], "dir")
+    return _skipped(".", parts[0], "dir") or _skipped(".", parts[0], "file")
+
+
+def _scan(rel_path: str = "."):
+    """
+    Обходит BASE_DIR/rel_path через os.scandir и возвращает строки
+    (path, parent, name, kind, mtime, size, inode).
+    """
+    rows = []
+    stack = [os.path.normpath(rel_path)]
+    while stack:
+        parent = stack.pop()
+        try:
+            it = os.scandir(os.path.join(BASE_DIR, parent))
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать папку {parent}: {e}")
+            continue
+        with it:
+            for entry in it:
+                try:
+                    kind = "dir" if entry.is_dir(follow_symlinks=False) else "file"
+                    if _skipped(parent, entry.name, kind):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    ino = entry.inode()
+                except OSError:
+                    continue
+                path = os.path.normpath(os.path.join(parent, entry.name))
+                rows.append((path, parent, entry.name, kind, st.st_mtime, st.st_size, ino))
+                if kind == "dir":
+                    stack.append(path)
+    return rows
+
+
+def generation() -> int:
+    """Номер версии индекса — меняется при любом изменении записей."""
+    return _gen
+
+
+def partition_of(path: str) -> str:
+    """
+    Раздел индекса для пути: роль верхней папки (как в get_top_role_folder),
+    иначе имя верхней папки; записи в самом корне BASE_DIR — раздел "".
+    """
+    if os.sep not in path:
+        return ""
+    return get_top_role_folder(path) or path.split(os.sep, 1)[0]
+
+
+def _clear():
+    _ids.clear()
+    _items.clear()
+    _paths.clear()
+    _sigs.clear()
+    _parts.clear()
+
+
+def _name_words(name_lower: str):
+    return set(_words(name_lower))
+
+
+# До скольких вставок/удалений править список слов на месте: каждая правка
+# сдвигает хвост списка, и при большем числе дешевле один проход целиком
+_WORDS_INPLACE_LIMIT = 64
+
+
+def _merge_words(part, pairs):
+    # Немного слов — вставляем на место, много (загрузка, обход) — одна сортировка
+    if len(pairs) <= _WORDS_INPLACE_LIMIT:
+        for pair in pairs:
+            bisect.insort(part.words, pair)
+    else:
+        part.words = sorted(part.words + pairs)
+
+
+def _drop_words(part, ids):
+    if len(ids) * 4 <= _WORDS_INPLACE_LIMIT:
+        for i in ids:
+            for w in _name_words(_items[i][3]):
+                k = bisect.bisect_left(part.words, (w, i))
+                if k < len(part.words) and part.words[k] == (w, i):
+                    del part.words[k]
+    else:
+        part.words = [pair for pair in part.words if pair[1] not in ids]
+
+
+def _apply_add(rows):
+    """Добавляет новые записи и обновляет подписи уже известных."""
+    global _gen
+    _gen += 1
+    new_words = defaultdict(list)
+    for path, parent, name, kind, mtime, size, inode in rows:
+        i = _ids.get(path)
+        if i is not None:
+            _sigs[i] = (mtime, size, inode)
+            continue
+        i = len(_items)
+        name_lower = name.lower()
+        _ids[path] = i
+        _items.append((kind, parent, name, name_lower))
+        _paths.append(path)
+        _sigs.append((mtime, size, inode))
+        part = _parts[partition_of(path)]
+        part.ids.add(i)
+        part.gen += 1
+        if kind == "file":
+            new_words[part].extend((w, i) for w in _name_words(name_lower))
+    for part, pairs in new_words.items():
+        _merge_words(part, pairs)
+
+
+def _outermost(paths):
+    """Оставляет из путей только те, ни один предок которых не входит в набор."""
+    paths = set(paths)
+    result = []
+    for p in paths:
+        parent = os.path.dirname(p)
+        while parent and parent not in paths:
+            parent = os.path.dirname(parent)
+        if not parent:
+            result.append(p)
+    return result
+
+
+def _descendants(dirs):
+    """Пути индекса внутри папок dirs — одним проходом по индексу."""
+    if len(dirs) <= 32:
+        prefixes = tuple(d + os.sep for d in dirs)
+        return [p for p in _ids if p.startswith(prefixes)]
+    dirs = set(dirs)
+    found = []
+    for p in _ids:
+        parent = os.path.dirname(p)
+        while parent:
+            if parent in dirs:
+                found.append(p)
+                break
+            parent = os.path.dirname(parent)
+    return found
+
+
+def _apply_remove(paths, with_children: bool = True):
+    """
+    Убирает пути из индекса одной пачкой. with_children=False — в paths уже
+    есть всё содержимое удаляемых папок (как у rescan), искать его не нужно.
+    """
+    global _gen
+    _gen += 1
+    targets = _outermost(paths) if with_children else list(paths)
+    doomed = {p for p in targets if p in _ids}
+    if with_children:
+        # Папки (и неизвестные индексу пути) могут тянуть за собой содержимое
+        dirs = [p for p in targets if p not in _ids or _items[_ids[p]][0] == "dir"]
+        if dirs:
+            doomed.update(_descendants(dirs))
+    gone = []
+    gone_files = defaultdict(set)
+    for p in doomed:
+        i = _ids.pop(p)
+        gone.append(i)
+        part = _parts[partition_of(p)]
+        if _items[i][0] == "file":
+            gone_files[part].add(i)
+        part.ids.discard(i)
+        part.gen += 1
+    # Слова убираем до того, как запись станет None: по имени ищется их место
+    for part, ids in gone_files.items():
+        _drop_words(part, ids)
+    for i in gone:
+        _items[i] = None
+
+
+def _live_rows():
+    rows = []
+    for path, i in _ids.items():
+        kind, parent, name, _ = _items[i]
+        rows.append((path, parent, name, kind) + _sigs[i])
+    return rows
+
+
+def _compact():
+    """Пересобирает структуры без удалённых id."""
+    rows = _live_rows()
+    _clear()
+    _apply_add(rows)
+
+
+def load():
+    """Загружает сохранённый индекс из БД в память."""
+    rows = db.get_fs_entries()
+    with _lock:
+        _clear()
+        _apply_add(rows)
+    logger.info(f"Индекс файлов загружен из БД: {len(rows)} записей")
+
+
+def rescan() -> dict:
+    """
+    Обходит BASE_DIR и применяет к индексу только отличия: новые и
+    пропавшие пути, изменившиеся (mtime, размер, inode). Вызывать не из
+    цикла событий. Возвращает статистику обхода (она же в last_scan).
+    """
+    global _touched
+    if not _scan_lock.acquire(blocking=False):
+        return {}
+    started = time.monotonic()
+    try:
+        with _lock:
+            _touched = []
+        try:
+            rows = _scan()
+        finally:
+            with _lock:
+                touched, _touched = tuple(_touched), None
+
+        def fresh(p):
+            return not any(p == t or p.startswith(t + os.sep) for t in touched)
+
+        with _lock:
+            seen = set()
+            upserts = []
+            added = changed = 0
+            for row in rows:
+                path = row[0]
+                seen.add(path)
+                if touched and not fresh(path):
+                    continue
+                i = _ids.get(path)
+                if i is None:
+                    added += 1
+                elif _sigs[i] != row[4:]:
+                    if row[3] == "file":
+                        changed += 1
+                else:
+                    continue
+                upserts.append(row)
+            removed = [p for p in _ids if p not in seen and (not touched or fresh(p))]
+            if upserts:
+                _apply_add(upserts)
+            if removed:
+                _apply_remove(removed, with_children=False)
+            if len(_items) > 2 * len(_ids) + 1000:
+                _compact()
+            total = len(_ids)
+        db.apply_fs_changes(upserts, removed)
+
+        stats = {
+            "finished": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "duration": round(time.monotonic() - started, 2),
+            "total": total,
+            "added": added,
+            "changed": changed,
+            "removed": len(removed),
+        }
+        last_scan.clear()
+        last_scan.update(stats)
+        if added or changed or removed:
+            logger.info(f"Индекс файлов обновлён: {stats}")
+        return stats
+    except Exception as e:
+        logger.error(f"Ошибка обхода BASE_DIR для индекса файлов: {e}")
+        return {}
+    finally:
+        _scan_lock.release()
+
+
+def start():
+    """Загружает индекс из БД и запускает обход диска в фоне."""
+    try:
+        load()
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить индекс файлов из БД: {e}")
+    threading.Thread(target=rescan, name="file-index", daemon=True).start()
+
+
+def _record(path: str):
+    if _touched is not None:
+        _touched.append(path)
+
+
+def _collect(paths):
+    rows = []
+    for rel_path in paths:
+        try:
+            st = os.stat(os.path.join(BASE_DIR, rel_path))
+        except FileNotFoundError:
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            rows.append(_row(rel_path, "dir", st))
+            rows.extend(_scan(rel_path))
+        else:
+            rows.append(_row(rel_path, "file", st))
+    return [r for r in rows if not _skipped(r[1], r[2], r[3])]
+
+
+async def note_added_many(rel_paths):
+    """
+    Добавляет в индекс файлы и папки (вместе с содержимым) по путям от
+    BASE_DIR одной пачкой. Пути внутри уже добавляемых папок пропускаются.
+    """
+    paths = _outermost(os.path.normpath(p) for p in rel_paths)
+    if not paths:
+        return
+    try:
+        rows = await asyncio.to_thread(_collect, paths)
+        with _lock:
+            if rows:
+                _apply_add(rows)
+            for p in paths:
+                _record(p)
+        if rows:
+            await db_async.apply_fs_changes(rows, [])
+    except Exception as e:
+        logger.warning(f"Не удалось добавить в индекс файлов {paths[:5]}: {e}")
+
+
+async def note_added(rel_path: str):
+    """Добавляет в индекс файл или папку (вместе с содержимым) по пути от BASE_DIR."""
+    await note_added_many([rel_path])
+
+
+async def note_removed_many(rel_paths):
+    """Убирает из индекса файлы и папки со всем содержимым одной пачкой."""
+    paths = _outermost(os.path.normpath(p) for p in rel_paths)
+    if not paths:
+        return
+    try:
+        with _lock:
+            _apply_remove(paths)
+            for p in paths:
+                _record(p)
+        await db_async.delete_fs_entries(paths)
+    except Exception as e:
+        logger.warning(f"Не удалось убрать из индекса файлов {paths[:5]}: {e}")
+
+
+async def note_removed(rel_path: str):
+    """Убирает из индекса файл или папку со всем содержимым."""
+    await note_removed_many([rel_path])
+
+
+def contains(rel_path: str) -> bool:
+    with _lock:
+        return os.path.normpath(rel_path) in _ids
+
+
+def all_paths():
+    """Возвращает пути всех файлов и папок индекса."""
+    with _lock:
+        return list(_ids)
+
+
+def files_with_signatures():
+    """Возвращает [(path, name, mtime, size), ...] для всех файлов индекса."""
+    with _lock:
+        return [
+            (p, _items[i][2], _sigs[i][0], _sigs[i][1])
+            for p, i in _ids.items() if _items[i][0] == "file"
+        ]
+
+
+def _selected(partitions):
+    if partitions is None:
+        return list(_parts.values())
+    return [_parts[p] for p in partitions if p in _parts]
+
+
+def search_view(partitions=None):
+    """
+    Все записи указанных разделов: (entries, names_lower), где entries —
+    [(kind, parent, name, name_lower), ...], а names_lower — имена для
+    пакетного сравнения (rapidfuzz.process.cdist). partitions=None — весь
+    индекс. Списки раздела собираются заново только после его изменения.
+    """
+    entries, names = [], []
+    with _lock:
+        for part in _selected(partitions):
+            if part.view is None or part.view[0] != part.gen:
+                items = [_items[i] for i in part.ids]
+                part.view = (part.gen, items, [e[3] for e in items])
+            entries += part.view[1]
+            names += part.view[2]
+    return entries, names
+
+
+# Слова — буквы и цифры; подчёркивание считается разделителем, как пробел:
+# большинство документов названы вида «2_1_3_Правила_приема_заявок.docx»
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def _words(text: str):
+    """
+    >>> _words("2_1_3_Правила_приёма.docx")
+    ['2', '1', '3', 'правила', 'приема', 'docx']
+    """
+    return _WORD_RE.findall(text.lower().replace("ё", "е"))
+
+
+def prefix_search(tokens, partitions=None, limit: int = 200):
+    """
+    Файлы, в имени которых с каждого слова запроса начинается какое-то
+    слово («отч 2024» найдёт «Отчёт за 2024.docx»). Поиск идёт двоичным
+    поиском по отсортированному списку слов имён раздела; список ведётся
+    при каждом изменении индекса, запрос его не пересобирает.
+    Возвращает [(path, name, mtime, size), ...] — не больше limit.
+    """
+    tokens = [w for t in tokens for w in _words(t)]
+    if not tokens:
+        return []
+    # Диапазон ищем по самому длинному слову — он уже всего
+    key = max(tokens, key=len)
+    result = []
+    seen = set()
+    with _lock:
+        for part in _selected(partitions):
+            words = part.words
+            k = bisect.bisect_left(words, (key,))
+            while k < len(words) and words[k][0].startswith(key) and len(result) < limit:
+                i = words[k][1]
+                k += 1
+                item = _items[i]
+                if i in seen or item is None:
+                    continue
+                seen.add(i)
+                name_words = _words(item[3])
+                if all(any(w.startswith(t) for w in name_words) for t in tokens):
+                    sig = _sigs[i]
+                    result.append((_paths[i], item[2], sig[0], sig[1]))
+    return result
@@ -0,0 +1,154 @@
+# fs_watch.py
+
+"""
+Слежение за изменениями в BASE_DIR (inotify в Linux, ReadDirectoryChangesW
+в Windows) через необязательный пакет watchdog.
+
+Поток наблюдателя только складывает события в очередь; разбирает их
+задача jobs.fs_watch_job раз в секунду в цикле событий бота: обновляет
+индексы поиска и оповещает роль о файлах, появившихся в её папке мимо
+бота. Пока наблюдатель работает, обход диска идёт реже
+(FS_WATCH_RESCAN_INTERVAL_MINUTES) — как страховка.
+
+Включается FS_WATCH=1 и только для локального диска: на сетевой папке
+inotify не сообщает об изменениях, сделанных другими компьютерами.
+
+Файлы, которые бот записал сам (загрузка через админку), помечаются
+mark_own_write(), чтобы не присылать по ним второе оповещение.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+import file_index
+from config import BASE_DIR
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд событие по пути, записанному ботом, считается «своим»
+_OWN_WRITE_TTL = 30
+
+_events = queue.SimpleQueue()
+_own_writes = {}
+_own_lock = threading.Lock()
+_observer = None
+
+
+def _rel(path):
+    if not path:
+        return None
+    rel = os.path.relpath(path, BASE_DIR)
+    if rel == "." or rel.startswith(".."):
+        return None
+    rel = os.path.normpath(rel)
+    # Файлы БД меняются при каждой записи, код бота не индексируется
+    return None if file_index.is_ignored(rel) else rel
+
+
+class _Handler(FileSystemEventHandler):
+    def on_any_event(self, event):
+        if event.event_type not in ("created", "deleted", "moved", "modified"):
+            return
+        if _rel(event.src_path) is None and _rel(getattr(event, "dest_path", None)) is None:
+            return
+        _events.put((
+            event.event_type,
+            event.src_path,
+            getattr(event, "dest_path", None),
+            event.is_directory,
+        ))
+
+
+def start() -> bool:
+    """Запускает наблюдатель. Возвращает False, если watchdog не установлен или не запустился."""
+    global _observer
+    if Observer is None:
+        logger.warning("Пакет watchdog не установлен — изменения в папках отслеживаются периодическим обходом.")
+        return False
+    try:
+        obs = Observer()
+        obs.schedule(_Handler(), BASE_DIR, recursive=True)
+        obs.daemon = True
+        obs.start()
+    except Exception as e:
+        logger.warning(f"Не удалось запустить слежение за {BASE_DIR}: {e}")
+        return False
+    _observer = obs
+    logger.info(f"Слежение за изменениями в {BASE_DIR} запущено")
+    return True
+
+
+def stop():
+    if _observer is not None:
+        _observer.stop()
+        _observer.join(timeout=5)
+
+
+def running() -> bool:
+    return _observer is not None and _observer.is_alive()
+
+
+def mark_own_write(rel_path: str):
+    """Отмечает путь (от BASE_DIR), который бот сейчас записывает сам."""
+    with _own_lock:
+        _own_writes[os.path.normpath(rel_path)] = time.monotonic() + _OWN_WRITE_TTL
+
+
+def is_own_write(rel_path: str) -> bool:
+    now = time.monotonic()
+    with _own_lock:
+        for p in [p for p, t in _own_writes.items() if t < now]:
+            del _own_writes[p]
+        return rel_path in _own_writes
+
+
+def is_temp_name(name: str) -> bool:
+    """Временные файлы офисных программ и недокачанные копии — о них не оповещаем."""
+    lower = name.lower()
+    return lower.startswith(("~", ".")) or lower.endswith((".tmp", ".part", ".crdownload"))
+
+
+def drain():
+    """
+    Забирает накопившиеся события и сворачивает их по путям.
+    Возвращает (removed, added, created_files): пути, которые нужно убрать
+    из индекса; пути, которые нужно (пере)добавить; файлы, созданные в
+    BASE_DIR или перенесённые в неё извне (кандидаты для оповещения).
+    """
+    removed, added, created_files = [], [], []
+    while True:
+        try:
+            kind, src, dest, is_dir = _events.get_nowait()
+        except queue.Empty:
+            break
+        src, dest = _rel(src), _rel(dest)
+        if kind == "moved":
+            if src:
+                removed.append(src)
+            if dest:
+                added.append(dest)
+                # Переименование внутри BASE_DIR новым файлом не считаем
+                if not src and not is_dir:
+                    created_files.append(dest)
+        elif kind == "deleted":
+            if src:
+                removed.append(src)
+        elif src:
+            # created / modified: папки меняют mtime при каждом изменении
+            # содержимого — это и так видно по событиям самих файлов
+            if is_dir and kind == "modified":
+                continue
+            added.append(src)
+            if kind == "created" and not is_dir:
+                created_files.append(src)
+    return removed, list(dict.fromkeys(added)), list(dict.fromkeys(created_files))
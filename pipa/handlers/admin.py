@@ -5,10 +5,9 @@ import sys
 import asyncio
 import shutil
 import logging
-import random
-import string
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import (
     ConversationHandler,
     CommandHandler,
@@ -17,11 +16,20 @@ from telegram.ext import (
     filters,
     ContextTypes
 )
-from db import (
+from db_async import (
     get_all_users, get_role, delete_user,
-    get_all_tests, insert_email
+    get_all_tests, insert_emails_for_role
 )
-from config import DEVELOPER_USERNAME, BASE_DIR, ROLES
+from config import DEVELOPER_USERNAME, BASE_DIR, DIR_PAGE_SIZE
+from paths import get_top_role_folder
+import file_index
+import doc_index
+import fs_watch
+import dir_listing
+import short_ids
+import file_ids
+from handlers.search import search_cache_stats
+from handlers.files import page_controls
 
 logger = logging.getLogger(__name__)
 
@@ -39,75 +47,32 @@ ADMIN_FILES_UPLOAD_CHOOSE_TEST = 603
 ############################
 # Утилиты
 ############################
-def is_admin_or_dev(update: Update) -> bool:
+async def is_admin_or_dev(update: Update) -> bool:
     user = update.callback_query.from_user if update.callback_query else update.effective_user
-    role = (get_role(user.id) or "").lower()
+    role = (await get_role(user.id) or "").lower()
     dev_name = (user.username or "").lower()
     return (role in ("администратор", "помощник директора")) or (dev_name == DEVELOPER_USERNAME.lower())
 
-def short_id(context: ContextTypes.DEFAULT_TYPE, name: str) -> str:
-    """Генерируем короткий ID и храним «short → name» в user_data."""
-    sid = ''.join(random.choices(string.ascii_letters+string.digits, k=8))
-    context.user_data.setdefault("short_map", {})[sid] = name
-    return sid
-
-def restore_id(context: ContextTypes.DEFAULT_TYPE, sid: str) -> str|None:
-    return context.user_data.get("short_map", {}).get(sid)
-
-def get_top_role_folder(rel_path: str) -> str|None:
+async def notify_role_about_file(role: str, filename: str, test_id=None, attachment=None):
     """
-    Возвращает имя роли, если «верхняя папка» из rel_path совпадает с одним из ROLES (без учёта регистра).
-    Игнорирует начальные "./" или ".\".
-
-    Пример:
-      rel_path = "./Помощник директора/папка1"
-      → вернёт "Помощник директора", если в ROLES есть "Помощник директора"
+    Создаём «непрочитанное» письмо для всех пользователей, у кого роль=role.
+    attachment — file_id самого файла, чтобы его можно было открыть прямо из письма.
     """
-    if not rel_path or rel_path == ".":
-        return None
-
-    # Удаляем ведущие "./" или ".\":
-    if rel_path.startswith("./") or rel_path.startswith(".\\"):
-        rel_path = rel_path[2:]  # отрезаем два символа
-
-    # Нормализуем слэши
-    rel_path = rel_path.replace("\\", "/").strip().lstrip("/")
-    if not rel_path:
-        return None
-
-    # Первый сегмент
-    parts = rel_path.split("/")
-    top = parts[0].strip()
-
-    # Сравниваем без учёта регистра и лишних пробелов
-    top_lower = top.lower()
-
-    for r in ROLES:  # ROLES из config.py
-        if r.lower() == top_lower:
-            return r
-
-    return None
-
-def notify_role_about_file(role: str, filename: str, test_id=None):
-    """Создаём «непрочитанное» письмо для всех пользователей, у кого роль=role."""
-    from db import get_all_users, insert_email
-    allu = get_all_users()
-    for (tid, nm, un, rl) in allu:
-        if (rl or "").lower() == role.lower():
-            subj = "Добавлен файл"
-            body = f"В папку роли '{role}' загружен файл '{filename}'."
-            if test_id:
-                body += f"\nК нему прикреплён тест ID={test_id}."
-            insert_email(tid, subj, body, None, test_id)
+    subj = "Добавлен файл"
+    body = f"В папку роли '{role}' загружен файл '{filename}'."
+    if test_id:
+        body += f"\nК нему прикреплён тест ID={test_id}."
+    await insert_emails_for_role(role, subj, body, attachment, test_id)
 
 ############################
 # 1) Админ-панель
 ############################
 async def return_to_main_menu_after_admin(query, context):
-    from db import get_role
+    from db_async import get_role, get_unread_count
     from handlers.keyboards import get_admin_keyboard, get_user_keyboard
     user_id = query.from_user.id
-    role = (get_role(user_id) or "").lower()
+    role = (await get_role(user_id) or "").lower()
+    unread = await get_unread_count(user_id)
     dev_name = (query.from_user.username or "").lower()
 
     # проверяем, админ ли (или помощник директора, или dev)
@@ -115,10 +80,10 @@ async def return_to_main_menu_after_admin(query, context):
 
     if is_admin_or_pom:
         text = f"Админ-панель завершена. Возвращаемся в меню для роли: {role}"
-        markup = get_admin_keyboard()
+        markup = get_admin_keyboard(unread)
     else:
         text = f"Админ-панель завершена. Возвращаемся в меню для роли: {role}"
-        markup = get_user_keyboard(role)
+        markup = get_user_keyboard(role, unread)
 
     try:
         await query.edit_message_text(text, reply_markup=markup)
@@ -128,7 +93,7 @@ async def return_to_main_menu_after_admin(query, context):
 
 async def admin_panel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Вход в админ-панель."""
-    if not is_admin_or_dev(update):
+    if not await is_admin_or_dev(update):
         if update.message:
             await update.message.reply_text("🚫 Нет прав.")
         else:
@@ -137,7 +102,7 @@ async def admin_panel_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     return await show_admin_menu(update, context)
 
 async def show_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    role = (get_role(update.effective_user.id) or "").lower()
+    role = (await get_role(update.effective_user.id) or "").lower()
     text = f"🔧 Админ-меню (Роль: {role}):"
 
     kb = []
@@ -147,7 +112,10 @@ async def show_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         InlineKeyboardButton("📋 Список пользователей", callback_data="admin_users"),
         InlineKeyboardButton("💬 Рассылка", callback_data="admin_broadcast")
     ])
-    kb.append([InlineKeyboardButton("🗂 Файлы", callback_data="admin_files")])
+    kb.append([
+        InlineKeyboardButton("🗂 Файлы", callback_data="admin_files"),
+        InlineKeyboardButton("📊 Индексы", callback_data="admin_stats")
+    ])
     kb.append([InlineKeyboardButton("🚪 Выход", callback_data="admin_exit")])
     markup = InlineKeyboardMarkup(kb)
 
@@ -179,7 +147,7 @@ async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         uid_str = data.split("_",1)[1]
         try:
             uid = int(uid_str)
-            delete_user(uid)
+            await delete_user(uid)
             await q.message.reply_text(f"Пользователь {uid} сброшен.")
         except:
             await q.answer("Ошибка ID!", show_alert=True)
@@ -196,6 +164,12 @@ async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         context.user_data["fm_message_id"] = q.message.message_id
         return await fm_browse(update, context, ".")
 
+    elif data == "admin_stats":
+        return await show_index_stats(update, context)
+
+    elif data == "admin_menu":
+        return await show_admin_menu(update, context)
+
     elif data == "admin_exit":
         from .admin import return_to_main_menu_after_admin
         await return_to_main_menu_after_admin(q, context)
@@ -209,8 +183,8 @@ async def admin_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def show_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
-    from db import get_all_users
-    us = get_all_users()
+    from db_async import get_all_users
+    us = await get_all_users()
     text = "📋 Список пользователей:\n"
     kb = []
     for (tid, nm, un, rl) in us:
@@ -220,14 +194,46 @@ async def show_users_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await q.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb))
     return ADMIN_MENU
 
+def _format_stats(title: str, stats: dict, fields) -> str:
+    if not stats:
+        return f"{title}: ещё не обновлялся."
+    lines = [f"{title} (обновлён {stats['finished']}, за {stats['duration']} с):"]
+    for key, label in fields:
+        lines.append(f"  {label}: {stats.get(key, 0)}")
+    return "\n".join(lines)
+
+async def show_index_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    text = "📊 Индексы поиска\n\n" + _format_stats("Имена файлов", file_index.last_scan, [
+        ("total", "записей"), ("added", "новых"), ("changed", "изменённых файлов"), ("removed", "удалённых"),
+    ])
+    if doc_index.enabled():
+        text += "\n\n" + _format_stats("Текст документов", doc_index.last_sync, [
+            ("total", "документов"), ("indexed", "переиндексировано"), ("removed", "удалено"),
+        ])
+    else:
+        text += "\n\nПоиск по тексту документов отключён (нет FTS5)."
+    text += (
+        f"\n\nКэш результатов поиска: попаданий {search_cache_stats['hits']}, "
+        f"промахов {search_cache_stats['misses']}"
+    )
+    kb = [
+        [InlineKeyboardButton("🔄 Обновить", callback_data="admin_stats")],
+        [InlineKeyboardButton("Назад", callback_data="admin_menu")],
+    ]
+    try:
+        await q.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb))
+    except BadRequest as e:
+        if "Message is not modified" not in str(e):
+            raise
+    return ADMIN_MENU
+
 async def admin_broadcast_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     txt = update.message.text.strip()
-    from db import get_all_users, insert_email
-    for (tid, nm, un, rl) in get_all_users():
-        try:
-            insert_email(tid, "Рассылка", txt, None, None)
-        except Exception as e:
-            logger.warning(f"Ошибка рассылки {tid}: {e}")
+    try:
+        await insert_emails_for_role(None, "Рассылка", txt, None, None)
+    except Exception as e:
+        logger.warning(f"Ошибка рассылки: {e}")
     await update.message.reply_text("Рассылка выполнена!")
     return await admin_panel_command(update, context)
 
@@ -245,13 +251,18 @@ async def force_end_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def get_main_fm_msg(context):
     return context.user_data.get("fm_chat_id"), context.user_data.get("fm_message_id")
 
-async def fm_browse(update: Update, context: ContextTypes.DEFAULT_TYPE, rel_path: str):
-    context.user_data["fm_curdir"] = rel_path
+async def fm_browse(update: Update, context: ContextTypes.DEFAULT_TYPE, rel_path: str, page: int | None = None):
+    """Показывает страницу папки rel_path; page=None — та же страница, если папка не сменилась."""
+    ud = context.user_data
+    if page is None:
+        page = ud.get("fm_page", 0) if ud.get("fm_curdir") == rel_path else 0
+    order = ud.get("fm_order", "name")
+    ud["fm_curdir"] = rel_path
     bot = context.bot
     chat_id, msg_id = get_main_fm_msg(context)
-    abs_path = os.path.join(BASE_DIR, rel_path)
+    listing = await dir_listing.list_dir(rel_path, order)
 
-    if not os.path.isdir(abs_path):
+    if listing is None:
         kb = [[InlineKeyboardButton("Выйти", callback_data="fm_exit")]]
         await bot.edit_message_text(
             chat_id=chat_id, message_id=msg_id,
@@ -260,32 +271,22 @@ async def fm_browse(update: Update, context: ContextTypes.DEFAULT_TYPE, rel_path
         )
         return ADMIN_FILES_BROWSE
 
-    items = sorted(os.listdir(abs_path))
-    dirs, files = [], []
+    # Папку "pipa" (код бота) dir_listing в корне не показывает
+    entries, page, pages = dir_listing.page_of(listing, page, DIR_PAGE_SIZE)
+    ud["fm_page"] = page
 
-    for it in items:
-        # 1) Пропускаем папку "pipa" (не добавляем её в списки)
-        if it.lower() == "pipa":
-            continue
-
-        fp = os.path.join(abs_path, it)
-        if os.path.isdir(fp):
-            dirs.append(it)
-        else:
-            files.append(it)
-
-    # дальше всё как у вас
     kb = []
-    for d in dirs:
-        sid = short_id(context, d)
-        kb.append([
-            InlineKeyboardButton(f"📁 {d}", callback_data=f"fm_goto|{sid}"),
-            InlineKeyboardButton("🗑", callback_data=f"fm_rmdir|{sid}")
-        ])
-        
-    for f in files:
-        sf = short_id(context, f)
-        kb.append([InlineKeyboardButton(f"📄 {f}", callback_data=f"fm_file|{sf}")])
+    for name, is_dir in entries:
+        sid = short_ids.make(context, os.path.join(rel_path, name))
+        if is_dir:
+            kb.append([
+                InlineKeyboardButton(f"📁 {name}", callback_data=f"fm_goto|{sid}"),
+                InlineKeyboardButton("🗑", callback_data=f"fm_rmdir|{sid}")
+            ])
+        else:
+            kb.append([InlineKeyboardButton(f"📄 {name}", callback_data=f"fm_file|{sid}")])
+    if listing:
+        kb.append(page_controls("fm_", page, pages, order))
 
     row = [InlineKeyboardButton("Загрузить файл", callback_data="fm_upload")]
     if rel_path != ".":
@@ -294,6 +295,8 @@ async def fm_browse(update: Update, context: ContextTypes.DEFAULT_TYPE, rel_path
     kb.append([InlineKeyboardButton("Выйти", callback_data="fm_exit")])
 
     text = f"Папка: /{rel_path}"
+    if pages > 1:
+        text += f"\nСтраница {page + 1} из {pages} ({len(listing)} шт.)"
     markup = InlineKeyboardMarkup(kb)
     await bot.edit_message_text(
         chat_id=chat_id,
@@ -320,9 +323,8 @@ async def fm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data.startswith("fm_goto|"):
         sid = data.split("|", 1)[1]
-        folder_name = restore_id(context, sid)
-        if folder_name:
-            newp = os.path.join(cur, folder_name)
+        newp = await short_ids.resolve(context, sid)
+        if newp:
             return await fm_browse(update, context, newp)
         else:
             await q.message.reply_text("Ошибка папки!")
@@ -330,19 +332,25 @@ async def fm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data.startswith("fm_rmdir|"):
         sid = data.split("|", 1)[1]
-        folder_name = restore_id(context, sid)
-        if folder_name:
-            fullp = os.path.join(BASE_DIR, cur, folder_name)
+        folder_rel = await short_ids.resolve(context, sid)
+        if folder_rel:
+            fullp = os.path.join(BASE_DIR, folder_rel)
             try:
                 shutil.rmtree(fullp)
+                await file_index.note_removed(folder_rel)
             except Exception as e:
-                logger.warning(f"Ошибка удаления папки {folder_name}: {e}")
+                logger.warning(f"Ошибка удаления папки {folder_rel}: {e}")
+            # rmtree мог успеть удалить часть содержимого — список папки перечитываем в любом случае
+            dir_listing.invalidate(folder_rel)
         return await fm_browse(update, context, cur)
 
     elif data.startswith("fm_file|"):
         fid = data.split("|", 1)[1]
-        fname = restore_id(context, fid)
-        text = f"Файл: /{os.path.join(cur, fname)}"
+        file_rel = await short_ids.resolve(context, fid)
+        if not file_rel:
+            await q.message.reply_text("Ошибка файла!")
+            return ADMIN_FILES_BROWSE
+        text = f"Файл: /{file_rel}"
         kb = [
             [InlineKeyboardButton("🗑 Удалить", callback_data=f"fm_file_del|{fid}"),
              InlineKeyboardButton("Скачать", callback_data=f"fm_file_dl|{fid}")],
@@ -353,11 +361,13 @@ async def fm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data.startswith("fm_file_del|"):
         fid = data.split("|", 1)[1]
-        fname = restore_id(context, fid)
-        if fname:
-            fullf = os.path.join(BASE_DIR, cur, fname)
+        file_rel = await short_ids.resolve(context, fid)
+        if file_rel:
+            fullf = os.path.join(BASE_DIR, file_rel)
             try:
                 os.remove(fullf)
+                await file_index.note_removed(file_rel)
+                dir_listing.invalidate(file_rel)
             except Exception as e:
                 logger.warning(f"Ошибка удаления файла {fullf}: {e}")
         return await fm_browse(update, context, cur)
@@ -366,6 +376,15 @@ async def fm_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await q.answer("Скачивание не реализовано", show_alert=True)
         return ADMIN_FILES_BROWSE
 
+    elif data.startswith("fm_page|"):
+        value = data.split("|", 1)[1]
+        return await fm_browse(update, context, cur, int(value) if value.isdigit() else 0)
+
+    elif data.startswith("fm_sort|"):
+        value = data.split("|", 1)[1]
+        context.user_data["fm_order"] = value if value in dir_listing.ORDERS else "name"
+        return await fm_browse(update, context, cur, 0)
+
     elif data == "fm_back":
         return await fm_browse(update, context, cur)
 
@@ -413,40 +432,55 @@ async def fm_upload_receive(update: Update, context: ContextTypes.DEFAULT_TYPE):
     os.makedirs(basep, exist_ok=True)
 
     saved_name = None
+    tg_file = None  # (file_id, file_unique_id, kind) — Telegram уже хранит файл
 
     if doc:
         fobj = await context.bot.get_file(doc.file_id)
         fname = doc.file_name or f"doc_{doc.file_unique_id}"
         fullp = os.path.join(basep, fname)
+        fs_watch.mark_own_write(os.path.join(cur, fname))
         await fobj.download_to_drive(fullp)
         saved_name = fname
+        tg_file = (doc.file_id, doc.file_unique_id, "document")
 
     elif photos:
         ph = photos[-1]
         fobj = await context.bot.get_file(ph.file_id)
         fname = f"photo_{ph.file_unique_id}.jpg"
         fullp = os.path.join(basep, fname)
+        fs_watch.mark_own_write(os.path.join(cur, fname))
         await fobj.download_to_drive(fullp)
         saved_name = fname
+        tg_file = (ph.file_id, ph.file_unique_id, "photo")
 
     elif video:
         fobj = await context.bot.get_file(video.file_id)
         fname = f"video_{video.file_unique_id}.mp4"
         fullp = os.path.join(basep, fname)
+        fs_watch.mark_own_write(os.path.join(cur, fname))
         await fobj.download_to_drive(fullp)
         saved_name = fname
+        tg_file = (video.file_id, video.file_unique_id, "video")
 
     if saved_name:
+        saved_rel = os.path.join(cur, saved_name)
+        await file_index.note_added(saved_rel)
+        dir_listing.invalidate(saved_rel)
+        # Запоминаем file_id, чтобы отдавать файл сотрудникам без повторной загрузки
+        await file_ids.store(saved_rel, *tg_file)
+
         # Удаляем сообщение пользователя (с самим файлом)
         try:
             await update.message.delete()
         except:
             pass
 
-        # Оповещаем роль (как было)
+        # Оповещаем роль; документ и фото прикладываем к письму
+        # (просмотр писем умеет показывать только их)
         role_top = get_top_role_folder(cur)
         if role_top:
-            notify_role_about_file(role_top, saved_name, test_id=None)
+            attachment = tg_file[0] if tg_file[2] in ("document", "photo") else None
+            await notify_role_about_file(role_top, saved_name, test_id=None, attachment=attachment)
 
         # Добавляем в user_data["fm_uploaded_list"]
         context.user_data.setdefault("fm_uploaded_list", [])
@@ -525,12 +559,11 @@ async def fm_upload_asktest_handler(update: Update, context: ContextTypes.DEFAUL
     else:
         # data == "fm_attachtest_yes"
         # Показать список тестов, как раньше
-        tests = get_all_tests()
+        tests = await get_all_tests()
         kb = []
         if tests:
             for (tid, header, link, fg, rl, uid, attach_id) in tests:
-                sid = short_id(context, str(tid))
-                kb.append([InlineKeyboardButton(f"📝 {header}", callback_data=f"fm_testchoose:{sid}")])
+                kb.append([InlineKeyboardButton(f"📝 {header}", callback_data=f"fm_testchoose:{tid}")])
         else:
             kb.append([InlineKeyboardButton("Нет тестов", callback_data="fm_testnone")])
         kb.append([InlineKeyboardButton("Отмена", callback_data="fm_attachtest_no")])
@@ -542,22 +575,18 @@ async def fm_upload_test_chosen(update: Update, context: ContextTypes.DEFAULT_TY
     q = update.callback_query
     await q.answer()
     test_str = q.data.split(":",1)[1]
-    real = restore_id(context, test_str)
-    if real:
-        test_id = int(real)
+    if test_str.isdigit():
+        test_id = int(test_str)
         lastf = context.user_data.get("last_uploaded_file","")
         cur = context.user_data.get("fm_curdir",".")
         role_top = get_top_role_folder(cur)
         if role_top:
-            from db import get_all_users, insert_email
-            for (tid, nm, un, rl) in get_all_users():
-                if (rl or "").lower() == role_top.lower():
-                    subj = f"Файл + Тест: {lastf}"  # или "Файл + Тест в Водитель: {lastf}"
-                    body = (
-                        f"К файлу '{lastf}' прикреплён тест (ID={test_id}).\n"
-                    "Нажмите «Прочитано», чтобы увидеть ссылку на тест."
-                    )
-                    insert_email(tid, subj, body, None, test_id)
+            subj = f"Файл + Тест: {lastf}"  # или "Файл + Тест в Водитель: {lastf}"
+            body = (
+                f"К файлу '{lastf}' прикреплён тест (ID={test_id}).\n"
+                "Нажмите «Прочитано», чтобы увидеть ссылку на тест."
+            )
+            await insert_emails_for_role(role_top, subj, body, None, test_id)
         await q.message.edit_text(f"Тест {test_id} прикреплён к '{lastf}'. Уведомление отправлено роли {role_top}.\n\nВозвращаемся в список...")
     
     # Вместо удаления главного сообщения — снова показываем список
@@ -603,7 +632,7 @@ admin_conv = ConversationHandler(
         ADMIN_MENU: [
             CallbackQueryHandler(
                 admin_menu_handler,
-                pattern="^(admin_restart|admin_users|admin_broadcast|admin_files|admin_exit|reset_.*)$"
+                pattern="^(admin_restart|admin_users|admin_broadcast|admin_files|admin_stats|admin_menu|admin_exit|reset_.*)$"
             )
         ],
         # Рассылка
@@ -614,7 +643,7 @@ admin_conv = ConversationHandler(
         ADMIN_FILES_BROWSE: [
             CallbackQueryHandler(
                 fm_handler,
-                pattern="^(fm_exit|fm_updir|fm_goto\\|.*|fm_rmdir\\|.*|fm_file\\|.*|fm_file_del\\|.*|fm_file_dl\\|.*|fm_back|fm_upload)$"
+                pattern="^(fm_exit|fm_updir|fm_goto\\|.*|fm_rmdir\\|.*|fm_file\\|.*|fm_file_del\\|.*|fm_file_dl\\|.*|fm_page\\|.*|fm_sort\\|.*|fm_back|fm_upload)$"
             )
         ],
         ADMIN_FILES_UPLOAD: [
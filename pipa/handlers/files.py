@@ -1,21 +1,25 @@
 import os
 import logging
-import uuid
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from config import BASE_DIR
-from db import get_role
+from config import BASE_DIR, DIR_PAGE_SIZE, DEVELOPER_USERNAME
+from db_async import get_role
+import file_ids
+import dir_listing
+import short_ids
 from telegram.error import BadRequest
 
 logger = logging.getLogger(__name__)
 
-def get_short_id(context, rel_path: str) -> str:
-    """Генерирует короткий ID и сохраняет путь rel_path в context.user_data["path_map"][short_id]."""
-    if "path_map" not in context.user_data:
-        context.user_data["path_map"] = {}
-    short_id = uuid.uuid4().hex[:8]
-    context.user_data["path_map"][short_id] = rel_path
-    return short_id
+def _user_roots(user, role: str):
+    """
+    Верхние папки, доступные пользователю в файловом браузере (None — все).
+    Как и в поиске, без ограничений — администратор и разработчик.
+    """
+    dev_name = (user.username or "").lower()
+    if role.lower() == "администратор" or dev_name == DEVELOPER_USERNAME.lower():
+        return None
+    return ("Общая", role)
 
 async def safe_edit_menu(query, text: str, markup=None):
     """
@@ -37,53 +41,63 @@ async def safe_edit_menu(query, text: str, markup=None):
         else:
             await query.message.chat.send_message(text)
 
+def page_controls(prefix: str, page: int, pages: int, order: str):
+    """Ряд кнопок листания и переключения сортировки (callback_data: <prefix>page|N, <prefix>sort|order)."""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("⬅️ Пред.", callback_data=f"{prefix}page|{page - 1}"))
+    if order == "date":
+        row.append(InlineKeyboardButton("🔤 По имени", callback_data=f"{prefix}sort|name"))
+    else:
+        row.append(InlineKeyboardButton("🕒 По дате", callback_data=f"{prefix}sort|date"))
+    if page + 1 < pages:
+        row.append(InlineKeyboardButton("След. ➡️", callback_data=f"{prefix}page|{page + 1}"))
+    return row
+
 async def browse_directory(query, context: ContextTypes.DEFAULT_TYPE,
-                           rel_path: str, is_admin: bool, allowed_root: str):
+                           rel_path: str, is_admin: bool, allowed_root: str, page: int | None = None):
     """
     Открывает содержимое директории (BASE_DIR/rel_path):
-      - Показывает папки и файлы, генерируя кнопки с короткими ID.
+      - Показывает страницу папок и файлов (DIR_PAGE_SIZE штук), генерируя кнопки с короткими ID.
+      - page=None — та же страница, если папка не сменилась, иначе первая.
       - Если rel_path != allowed_root, добавляет кнопку "🔙 Назад", иначе "🚪 В главное меню".
       - Сохраняет текущую директорию в context.user_data["current_dir"].
     """
-    full_path = os.path.join(BASE_DIR, rel_path)
-    if not os.path.isdir(full_path):
-        await safe_edit_menu(query, f"❌ Директория /{rel_path} не найдена!")
-        return
-
-    context.user_data["current_dir"] = rel_path
-
+    ud = context.user_data
+    order = ud.get("dir_order", "name")
+    if page is None:
+        page = ud.get("dir_page", 0) if ud.get("current_dir") == rel_path else 0
     try:
-        items = sorted(os.listdir(full_path))
+        listing = await dir_listing.list_dir(rel_path, order)
     except Exception as e:
-        logger.error(f"Ошибка при чтении директории {full_path}: {e}")
+        logger.error(f"Ошибка при чтении директории {os.path.join(BASE_DIR, rel_path)}: {e}")
         await safe_edit_menu(query, f"❌ Ошибка при чтении /{rel_path}.")
         return
+    if listing is None:
+        await safe_edit_menu(query, f"❌ Директория /{rel_path} не найдена!")
+        return
 
-    dirs = []
-    files = []
-    for item in items:
-        item_full = os.path.join(full_path, item)
-        if os.path.isdir(item_full):
-            dirs.append(item)
-        elif os.path.isfile(item_full):
-            files.append(item)
+    entries, page, pages = dir_listing.page_of(listing, page, DIR_PAGE_SIZE)
+    ud["current_dir"] = rel_path
+    ud["dir_page"] = page
+    ud["dir_root"] = (is_admin, allowed_root)
 
     keyboard = []
-    # Кнопки для папок
-    for d in dirs:
-        new_rel = os.path.join(rel_path, d)
-        short_id = get_short_id(context, new_rel)
-        keyboard.append([InlineKeyboardButton(f"📁 {d}", callback_data=f"dir|{short_id}")])
-    # Кнопки для файлов
-    for f in files:
-        file_rel = os.path.join(rel_path, f)
-        short_id = get_short_id(context, file_rel)
-        keyboard.append([InlineKeyboardButton(f"📄 {f}", callback_data=f"file|{short_id}")])
-
-    if not dirs and not files:
+    # Кнопки только для папок и файлов текущей страницы
+    for name, is_dir in entries:
+        short_id = short_ids.make(context, os.path.join(rel_path, name))
+        if is_dir:
+            keyboard.append([InlineKeyboardButton(f"📁 {name}", callback_data=f"dir|{short_id}")])
+        else:
+            keyboard.append([InlineKeyboardButton(f"📄 {name}", callback_data=f"file|{short_id}")])
+
+    if not listing:
         text = f"📂 Папка /{rel_path} пуста."
     else:
         text = f"📁 Папка: /{rel_path}"
+        if pages > 1:
+            text += f"\nСтраница {page + 1} из {pages} ({len(listing)} шт.)"
+        keyboard.append(page_controls("dir", page, pages, order))
 
     # Кнопка назад или в меню
     if rel_path != allowed_root:
@@ -93,6 +107,24 @@ async def browse_directory(query, context: ContextTypes.DEFAULT_TYPE,
 
     await safe_edit_menu(query, text, InlineKeyboardMarkup(keyboard))
 
+async def dir_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание текущей папки: "dirpage|<N>" — страница, "dirsort|<name|date>" — сортировка."""
+    query = update.callback_query
+    await query.answer()
+    rel_path = context.user_data.get("current_dir")
+    root = context.user_data.get("dir_root")
+    if not rel_path or not root:
+        await query.answer("❌ Откройте папку заново.", show_alert=True)
+        return
+    action, value = query.data.split("|", 1)
+    if action == "dirsort":
+        context.user_data["dir_order"] = value if value in dir_listing.ORDERS else "name"
+        page = 0
+    else:
+        page = int(value) if value.isdigit() else 0
+    is_admin, allowed_root = root
+    await browse_directory(query, context, rel_path, is_admin, allowed_root, page)
+
 async def directory_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает нажатие на папку: callback_data формата "dir|<short_id>"."""
     query = update.callback_query
@@ -102,14 +134,13 @@ async def directory_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except ValueError:
         await query.answer("❌ Некорректные данные для открытия папки!", show_alert=True)
         return
-    path_map = context.user_data.get("path_map", {})
-    new_rel = path_map.get(short_id)
+    user_id = query.from_user.id
+    role = await get_role(user_id) or ""
+    is_admin = (role.lower() == "администратор")
+    new_rel = await short_ids.resolve(context, short_id, _user_roots(query.from_user, role))
     if not new_rel:
         await query.answer("❌ Путь не найден.", show_alert=True)
         return
-    user_id = query.from_user.id
-    role = get_role(user_id) or ""
-    is_admin = (role.lower() == "администратор")
     allowed_root = "Администратор" if is_admin else role
     await browse_directory(query, context, new_rel, is_admin, allowed_root)
 
@@ -122,8 +153,10 @@ async def file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except ValueError:
         await query.answer("❌ Некорректные данные для файла!", show_alert=True)
         return
-    path_map = context.user_data.get("path_map", {})
-    file_rel = path_map.get(short_id)
+    user_id = query.from_user.id
+    role = await get_role(user_id) or ""
+    is_admin = (role.lower() == "администратор")
+    file_rel = await short_ids.resolve(context, short_id, _user_roots(query.from_user, role))
     if not file_rel:
         await query.answer("❌ Путь к файлу не найден.", show_alert=True)
         return
@@ -131,18 +164,14 @@ async def file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not os.path.isfile(full_path):
         await query.answer("❌ Файл не найден!", show_alert=True)
         return
-    # Отправляем файл пользователю
+    # Отправляем файл пользователю (по сохранённому file_id, если файл не менялся)
     try:
-        with open(full_path, "rb") as f:
-            await context.bot.send_document(chat_id=query.message.chat_id, document=f, filename=os.path.basename(full_path))
+        await file_ids.send_cached_document(context.bot, query.message.chat_id, file_rel)
     except Exception as e:
         logger.error(f"Ошибка при отправке файла {full_path}: {e}")
         await query.answer("❌ Ошибка при отправке файла!", show_alert=True)
         return
     # После отправки файла обновляем список директории (остаёмся в той же папке)
-    user_id = query.from_user.id
-    role = get_role(user_id) or ""
-    is_admin = (role.lower() == "администратор")
     allowed_root = "Администратор" if is_admin else role
     parent_dir = os.path.dirname(file_rel)
     await browse_directory(query, context, parent_dir or allowed_root, is_admin, allowed_root)
@@ -152,7 +181,7 @@ async def files_back_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    role = get_role(user_id) or ""
+    role = await get_role(user_id) or ""
     is_admin = (role.lower() == "администратор")
     allowed_root = "Администратор" if is_admin else role
     current_dir = context.user_data.get("current_dir", "")
@@ -177,7 +206,7 @@ async def handle_files_obshaya(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    role = get_role(user_id) or ""
+    role = await get_role(user_id) or ""
     is_admin = (role.lower() == "администратор")
     allowed_root = "Общая"
     rel_path = "Общая"
@@ -188,7 +217,7 @@ async def handle_files_role(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    role = get_role(user_id) or ""
+    role = await get_role(user_id) or ""
     is_admin = (role.lower() == "администратор")
     if is_admin:
         start_path = "Администратор"
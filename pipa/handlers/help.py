@@ -2,7 +2,7 @@
 
 from telegram import Update
 from telegram.ext import ContextTypes
-from db import get_role
+from db_async import get_role
 from config import DEVELOPER_USERNAME
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -23,7 +23,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     Навигация осуществляется исключительно через кнопки.
     """
     user_id = update.effective_user.id
-    role = get_role(user_id) or ""
+    role = await get_role(user_id) or ""
     dev_name = (update.effective_user.username or "").lower()
 
     if role.lower() == "администратор" or dev_name == DEVELOPER_USERNAME.lower():
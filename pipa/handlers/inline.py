@@ -0,0 +1,82 @@
+# inline.py
+
+"""
+Инлайн-режим: «@бот запрос» в любом чате.
+
+Ответ строится по префиксному индексу имён (file_index.prefix_search) в
+пределах тех же разделов, что и обычный поиск, и содержит только файлы,
+которые бот уже отправлял или получил через админку: для них Telegram
+знает file_id, и документ уходит в чат без загрузки с диска. Для работы
+в BotFather должен быть включён инлайн-режим (/setinline).
+"""
+
+import hashlib
+import logging
+import os
+
+from telegram import (
+    Update,
+    InlineQueryResultCachedDocument,
+    InlineQueryResultCachedPhoto,
+    InlineQueryResultCachedVideo,
+)
+from telegram.ext import ContextTypes
+
+import file_ids
+import file_index
+from config import BASE_DIR, OBSHAYA_DIR, DEVELOPER_USERNAME
+from db_async import get_role
+
+logger = logging.getLogger(__name__)
+
+# Telegram принимает не больше 50 результатов на ответ
+INLINE_RESULTS_LIMIT = 50
+
+
+def _result_id(path: str) -> str:
+    return hashlib.blake2b(path.encode("utf-8"), digest_size=8).hexdigest()
+
+
+async def inline_search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    iq = update.inline_query
+    tokens = iq.query.strip().lower().split()
+    user = iq.from_user
+    role = await get_role(user.id) or ""
+    dev_name = (user.username or "").lower()
+    is_admin = (role.lower() == "администратор" or dev_name == DEVELOPER_USERNAME.lower())
+
+    # Незарегистрированным и пустым запросам ничего не показываем
+    if not tokens or not (role or is_admin):
+        await iq.answer([], cache_time=5, is_personal=True)
+        return
+
+    # Те же правила доступа, что и в search_query_handler
+    if is_admin:
+        scope = None
+    else:
+        scope = [os.path.relpath(OBSHAYA_DIR, BASE_DIR), role]
+
+    hits = file_index.prefix_search(tokens, scope, limit=INLINE_RESULTS_LIMIT * 4)
+    known = await file_ids.lookup((path, mtime, size) for path, _, mtime, size in hits)
+
+    results = []
+    for path, name, _, _ in hits:
+        if path not in known:
+            continue
+        file_id, kind = known[path]
+        rid = _result_id(path)
+        description = f"/{os.path.dirname(path)}"
+        if kind == "photo":
+            res = InlineQueryResultCachedPhoto(id=rid, photo_file_id=file_id, title=name, description=description)
+        elif kind == "video":
+            res = InlineQueryResultCachedVideo(id=rid, video_file_id=file_id, title=name, description=description)
+        else:
+            res = InlineQueryResultCachedDocument(id=rid, title=name, document_file_id=file_id, description=description)
+        results.append(res)
+        if len(results) >= INLINE_RESULTS_LIMIT:
+            break
+
+    try:
+        await iq.answer(results, cache_time=30, is_personal=True)
+    except Exception as e:
+        logger.warning(f"Не удалось ответить на инлайн-запрос {iq.query!r}: {e}")
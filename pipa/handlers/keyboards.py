@@ -2,7 +2,11 @@
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
-def get_admin_keyboard():
+def mail_button_text(unread: int = 0) -> str:
+    """Подпись кнопки «Сообщения» со значком числа непрочитанных."""
+    return f"💬 Сообщения ({unread})" if unread else "💬 Сообщения"
+
+def get_admin_keyboard(unread: int = 0):
     return InlineKeyboardMarkup([
         [
             InlineKeyboardButton("📁 Общие файлы", callback_data="files_obshaya"),
@@ -10,14 +14,14 @@ def get_admin_keyboard():
         ],
         [
             InlineKeyboardButton("🔍 Поиск файлов", callback_data="search_files"),
-            InlineKeyboardButton("💬 Сообщения", callback_data="mail_main")
+            InlineKeyboardButton(mail_button_text(unread), callback_data="mail_main")
         ],
         [
             InlineKeyboardButton("🛠 Админ-панель", callback_data="admin_panel")
         ]
     ])
 
-def get_user_keyboard(role: str):
+def get_user_keyboard(role: str, unread: int = 0):
     return InlineKeyboardMarkup([
         [
             InlineKeyboardButton("📁 Общие файлы", callback_data="files_obshaya"),
@@ -25,6 +29,6 @@ def get_user_keyboard(role: str):
         ],
         [
             InlineKeyboardButton("🔍 Поиск файлов", callback_data="search_files"),
-            InlineKeyboardButton("💬 Сообщения", callback_data="mail_main")
+            InlineKeyboardButton(mail_button_text(unread), callback_data="mail_main")
         ]
     ])
@@ -12,12 +12,17 @@ from telegram.ext import (
 )
 
 # Предполагаем, что в db.py и config.py есть нужные функции/переменные:
-from db import (
-    get_role, get_all_users, get_user_by_id,
-    get_all_emails, insert_email, delete_email, mark_email_read,
-    get_unread_emails, get_read_emails, get_all_tests, insert_test
+from db_async import (
+    get_role, get_all_users, get_user_ids_by_role,
+    NO_ROLE, count_emails_by_role, get_emails_by_role,
+    insert_email, insert_emails_bulk, insert_emails_for_role,
+    delete_email, mark_email_read,
+    get_unread_emails, get_read_emails, get_unread_count, get_email_by_id, get_email_test_id,
+    get_user_test_ids, get_all_tests, get_test_by_id, get_tests_by_ids,
+    insert_test, delete_test
 )
-from config import DEVELOPER_USERNAME, ROLES
+from config import DEVELOPER_USERNAME, ROLES, MAIL_PAGE_SIZE
+from handlers.keyboards import mail_button_text
 
 logger = logging.getLogger(__name__)
 
@@ -58,8 +63,8 @@ MAIL_ALL_LIST = 411
 # Вспомогательные функции
 ########################################
 
-def is_admin_or_dev(query: CallbackQuery) -> bool:
-    role = (get_role(query.from_user.id) or "").lower()
+async def is_admin_or_dev(query: CallbackQuery) -> bool:
+    role = (await get_role(query.from_user.id) or "").lower()
     dev_name = (query.from_user.username or "").lower()
     return (role in ("администратор", "помощник директора")) or (dev_name == DEVELOPER_USERNAME.lower())
 
@@ -134,24 +139,24 @@ async def safe_edit_or_send(update, context, text: str, reply_markup=None):
         raise ValueError("safe_edit_or_send: не удалось определить тип update (CallbackQuery или message).")
 
 
-def get_admin_keyboard():
+def get_admin_keyboard(unread: int = 0):
     """Клавиатура для админов / помощников / разработчика."""
     kb = [
         [InlineKeyboardButton("📁 Общие файлы", callback_data="files_obshaya"),
          InlineKeyboardButton("📁 Файлы работы", callback_data="files_role")],
         [InlineKeyboardButton("🔍 Поиск", callback_data="search_files"),
-         InlineKeyboardButton("💬 Сообщения", callback_data="mail_main")],
+         InlineKeyboardButton(mail_button_text(unread), callback_data="mail_main")],
         [InlineKeyboardButton("🛠 Админ-панель", callback_data="admin_panel")]
     ]
     return InlineKeyboardMarkup(kb)
 
-def get_user_keyboard(role: str):
+def get_user_keyboard(role: str, unread: int = 0):
     """Клавиатура для обычных пользователей."""
     kb = [
         [InlineKeyboardButton("📁 Общие файлы", callback_data="files_obshaya"),
          InlineKeyboardButton("📁 Файлы работы", callback_data="files_role")],
         [InlineKeyboardButton("🔍 Поиск", callback_data="search_files"),
-         InlineKeyboardButton("💬 Сообщения", callback_data="mail_main")]
+         InlineKeyboardButton(mail_button_text(unread), callback_data="mail_main")]
     ]
     return InlineKeyboardMarkup(kb)
 
@@ -163,14 +168,15 @@ async def return_to_global_menu(query: CallbackQuery, context: ContextTypes.DEFA
     """
     from telegram.ext import ConversationHandler
     user_id = query.from_user.id
-    role = (get_role(user_id) or "").lower()
+    role = (await get_role(user_id) or "").lower()
     dev_name = (query.from_user.username or "").lower()
+    unread = await get_unread_count(user_id)
     if role in ("администратор", "помощник директора") or dev_name == DEVELOPER_USERNAME.lower():
         text = f"💬 Вы вышли из сообщений.\nАдмин-меню (роль: {role})"
-        markup = get_admin_keyboard()
+        markup = get_admin_keyboard(unread)
     else:
         text = f"💬 Вы вышли из сообщений.\nМеню для роли: {role}"
-        markup = get_user_keyboard(role)
+        markup = get_user_keyboard(role, unread)
     await query.edit_message_text(text, reply_markup=markup)
     return ConversationHandler.END
 
@@ -195,7 +201,7 @@ async def mail_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer()
 
     user_id = update.effective_user.id
-    role = (get_role(user_id) or "").lower()
+    role = (await get_role(user_id) or "").lower()
     dev_name = (update.effective_user.username or "").lower()
     can_admin = (role in ("администратор", "помощник директора")) or (dev_name == DEVELOPER_USERNAME.lower())
 
@@ -228,8 +234,10 @@ async def mail_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if data == "mail_exit":
         return await return_to_global_menu(query, context)
     elif data == "mail_unread":
+        context.user_data.pop("mail_unread_page", None)
         return await show_unread_inbox(query, context)
     elif data == "mail_read":
+        context.user_data.pop("mail_read_page", None)
         return await show_read_inbox(query, context)
     elif data == "mail_tests":
         return await show_tests_menu(update, context)
@@ -255,9 +263,44 @@ async def mail_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # 2) Непрочитанные/прочитанные
 ########################################
 
+async def fetch_mail_page(fetch, *args, page=None):
+    """
+    Загружает страницу писем через fetch(*args, limit=..., before_id=.../after_id=...).
+    page — (направление, id-якорь) из кнопок навигации или None для первой страницы.
+    Возвращает (rows, has_newer, has_older). Если страница опустела
+    (письма прочитаны/удалены), возвращает первую страницу.
+    """
+    n = MAIL_PAGE_SIZE
+    direction, anchor = page or ("older", None)
+    if direction == "newer":
+        rows = await fetch(*args, limit=n + 1, after_id=anchor)
+        has_newer, has_older, rows = len(rows) > n, True, rows[-n:]
+    else:
+        rows = await fetch(*args, limit=n + 1, before_id=anchor)
+        has_newer, has_older, rows = anchor is not None, len(rows) > n, rows[:n]
+    if not rows and page is not None:
+        return await fetch_mail_page(fetch, *args)
+    return rows, has_newer, has_older
+
+def page_nav_row(prefix: str, rows, has_newer: bool, has_older: bool):
+    """Кнопки «Новее/Старее» для страницы писем (callback_data: prefix:newer|older:<id>)."""
+    row = []
+    if rows and has_newer:
+        row.append(InlineKeyboardButton("⬅️ Новее", callback_data=f"{prefix}:newer:{rows[0][0]}"))
+    if rows and has_older:
+        row.append(InlineKeyboardButton("Старее ➡️", callback_data=f"{prefix}:older:{rows[-1][0]}"))
+    return row
+
+def parse_page_data(data: str):
+    """'prefix:newer|older:<id>' → (направление, id)."""
+    _, direction, anchor = data.split(":", 2)
+    return direction, int(anchor)
+
 async def show_unread_inbox(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
-    mails = get_unread_emails(user_id)  # [(mail_id, subj, body, att, test_id), ...]
+    page = context.user_data.get("mail_unread_page")
+    # [(mail_id, subj, body, att, test_id), ...]
+    mails, has_newer, has_older = await fetch_mail_page(get_unread_emails, user_id, page=page)
     if not mails:
         kb = [[InlineKeyboardButton("🔙 Назад", callback_data="mail_main")]]
         await safe_edit_menu(query, "📪 У вас нет новых сообщений.", InlineKeyboardMarkup(kb))
@@ -265,6 +308,9 @@ async def show_unread_inbox(query: CallbackQuery, context: ContextTypes.DEFAULT_
         kb = []
         for (m_id, s, b, a, t) in mails:
             kb.append([InlineKeyboardButton(s, callback_data=f"unread_mail:{m_id}")])
+        nav = page_nav_row("unread_page", mails, has_newer, has_older)
+        if nav:
+            kb.append(nav)
         kb.append([InlineKeyboardButton("🔙 Назад", callback_data="mail_main")])
         await safe_edit_menu(query, "📬 Непрочитанные сообщения:", InlineKeyboardMarkup(kb))
     return MAIL_MENU
@@ -275,18 +321,13 @@ async def open_unread_mail_handler(update: Update, context: ContextTypes.DEFAULT
     # data: "unread_mail:<mail_id>"
     _, mail_id_str = query.data.split(":", 1)
     mail_id = int(mail_id_str)
-    # Ищем письмо среди непрочитанных
-    all_unread = get_unread_emails(query.from_user.id)
-    found = None
-    for (m_id, s, b, a, t_id) in all_unread:
-        if m_id == mail_id:
-            found = (s, b, a, t_id)
-            break
-    if not found:
+    # Письмо должно принадлежать пользователю и быть непрочитанным
+    mail = await get_email_by_id(mail_id, query.from_user.id)
+    if not mail or mail[4] != "unread":
         await safe_edit_menu(query, "📪 Сообщение не найдено или уже прочитано.")
         return MAIL_MENU
 
-    subj, bod, att, test_id = found
+    _, _, subj, bod, _, att, test_id = mail
     text = f"📧 Тема: {subj}\n\n{bod}"
 
     # Попытка отправки вложения
@@ -311,8 +352,6 @@ async def open_unread_mail_handler(update: Update, context: ContextTypes.DEFAULT
     await safe_edit_menu(query, text, InlineKeyboardMarkup(kb))
     return MAIL_MENU
 
-from db import cursor, get_all_tests, mark_email_read
-
 async def mark_read_handler(update, context):
     query = update.callback_query
     await query.answer()
@@ -320,12 +359,10 @@ async def mark_read_handler(update, context):
     mail_id = int(mail_id_str)
 
     # 1. Узнаём, есть ли test_id у этого письма
-    cursor.execute("SELECT test_id FROM emails WHERE id=?", (mail_id,))
-    row = cursor.fetchone()
-    test_id = row[0] if row else None
+    test_id = await get_email_test_id(mail_id)
 
     # 2. Помечаем письмо прочитанным
-    mark_email_read(mail_id)
+    await mark_email_read(mail_id)
 
     # 3. Удаляем вложение (если было отправлено как отдельное сообщение)
     attach_id = context.user_data.pop("current_attachment_msg_id", None)
@@ -337,15 +374,9 @@ async def mark_read_handler(update, context):
 
     # 4. Если письмо содержит тест, показываем одну кнопку с URL (чтобы открыть в браузере)
     if test_id:
-        all_tests = get_all_tests()  # [(id, header, link, for_group, role, user_id, attach_id), ...]
-        found = None
-        for (tid, header, link, fg, rl, uid, attach_id) in all_tests:
-            if tid == test_id:
-                found = (header, link)
-                break
-        
-        if found:
-            header, link = found
+        test = await get_test_by_id(test_id)  # (id, header, link, for_group, role, user_id, attach_id)
+        if test:
+            header, link = test[1], test[2]
             text = (
                 "✅ Сообщение прочитано.\n"
                 f"У вас теперь доступен тест: «{header}»\n\n"
@@ -371,9 +402,18 @@ async def back_unread_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     return await show_unread_inbox(query, context)
 
+async def unread_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание непрочитанных: callback_data "unread_page:<newer|older>:<id>"."""
+    query = update.callback_query
+    await query.answer()
+    context.user_data["mail_unread_page"] = parse_page_data(query.data)
+    return await show_unread_inbox(query, context)
+
 async def show_read_inbox(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
-    mails = get_read_emails(user_id)  # [(mail_id, subj, body, att, test_id), ...]
+    page = context.user_data.get("mail_read_page")
+    # [(mail_id, subj, body, att, test_id), ...]
+    mails, has_newer, has_older = await fetch_mail_page(get_read_emails, user_id, page=page)
     if not mails:
         kb = [[InlineKeyboardButton("🔙 Назад", callback_data="mail_main")]]
         await safe_edit_menu(query, "📪 Нет прочитанных сообщений.", InlineKeyboardMarkup(kb))
@@ -381,6 +421,9 @@ async def show_read_inbox(query: CallbackQuery, context: ContextTypes.DEFAULT_TY
         kb = []
         for (m_id, s, b, a, t) in mails:
             kb.append([InlineKeyboardButton(s, callback_data=f"read_mail:{m_id}")])
+        nav = page_nav_row("read_page", mails, has_newer, has_older)
+        if nav:
+            kb.append(nav)
         kb.append([InlineKeyboardButton("🔙 Назад", callback_data="mail_main")])
         await safe_edit_menu(query, "📖 Прочитанные сообщения:", InlineKeyboardMarkup(kb))
     return MAIL_MENU
@@ -392,19 +435,13 @@ async def open_read_mail_handler(update: Update, context: ContextTypes.DEFAULT_T
     _, mail_id_str = query.data.split(":", 1)
     mail_id = int(mail_id_str)
 
-    # Ищем письмо среди прочитанных
-    all_read = get_read_emails(query.from_user.id)
-    found = None
-    for (m_id, subj, bod, att, test_id) in all_read:
-        if m_id == mail_id:
-            found = (subj, bod, att, test_id)
-            break
-
-    if not found:
+    # Письмо должно принадлежать пользователю и быть прочитанным
+    mail = await get_email_by_id(mail_id, query.from_user.id)
+    if not mail or mail[4] != "read":
         await safe_edit_menu(query, "Сообщение не найдено.")
         return MAIL_MENU
 
-    subj, bod, att, test_id = found
+    _, _, subj, bod, _, att, test_id = mail
     text = f"📧 Тема: {subj}\n\n{bod}"
 
     # Попытка отправки вложения
@@ -435,6 +472,13 @@ async def back_read_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     return await show_read_inbox(query, context)
 
+async def read_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание прочитанных: callback_data "read_page:<newer|older>:<id>"."""
+    query = update.callback_query
+    await query.answer()
+    context.user_data["mail_read_page"] = parse_page_data(query.data)
+    return await show_read_inbox(query, context)
+
 ########################################
 # 3) «Все сообщения» (админ)
 ########################################
@@ -445,52 +489,31 @@ async def mail_all_roles(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         query = update.callback_query
     # Теперь можно использовать query.from_user.id и т.д.
-    if not is_admin_or_dev(query):
+    if not await is_admin_or_dev(query):
         await safe_edit_menu(query, "Нет прав для просмотра всех сообщений.")
         return MAIL_MENU
-    all_list = get_all_emails()
-    if not all_list:
+    role_counts = await count_emails_by_role()  # [(role, count), ...]
+    if not role_counts:
         kb = [[InlineKeyboardButton("🔙 Назад", callback_data="mail_main")]]
         await safe_edit_menu(query, "📪 Нет сообщений.", InlineKeyboardMarkup(kb))
         return MAIL_MENU
 
-    role_to_mails = {}
-    for (m_id, rec, s, b, st, a, t_id) in all_list:
-        info = get_user_by_id(rec)
-        if not info:
-            role_to_mails.setdefault("Без роли", []).append((m_id, rec, s, b, st, a, t_id))
-        else:
-            r = info[2] or "Без роли"
-            role_to_mails.setdefault(r, []).append((m_id, rec, s, b, st, a, t_id))
-
     kb = []
-    for r, mails in role_to_mails.items():
-        if mails:
-            kb.append([InlineKeyboardButton(f"{r} ({len(mails)})", callback_data=f"mail_all_group:{r}")])
+    for r, cnt in role_counts:
+        kb.append([InlineKeyboardButton(f"{r} ({cnt})", callback_data=f"mail_all_group:{r}")])
     kb.append([InlineKeyboardButton("🔙 Назад", callback_data="mail_main")])
     await safe_edit_menu(query, "Выберите роль, чтобы посмотреть её письма:", InlineKeyboardMarkup(kb))
     return MAIL_ALL_ROLES
 
-async def mail_all_choose_role(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    _, chosen_role = query.data.split(":", 1)
-    all_list = get_all_emails()
-    relevant = []
-    for (m_id, rec, s, b, st, a, t_id) in all_list:
-        info = get_user_by_id(rec)
-        if info:
-            if info[2] == chosen_role:
-                relevant.append((m_id, rec, s, b, st, a, t_id))
-        else:
-            if chosen_role == "Без роли":
-                relevant.append((m_id, rec, s, b, st, a, t_id))
+async def show_mail_all_list(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE, chosen_role: str):
+    """Страница писем получателей роли chosen_role («Все сообщения»)."""
+    page = context.user_data.get("mail_all_page")
+    relevant, has_newer, has_older = await fetch_mail_page(get_emails_by_role, chosen_role, page=page)
     if not relevant:
         kb = [[InlineKeyboardButton("🔙 Назад", callback_data="mail_all")]]
         await query.edit_message_text(f"У роли '{chosen_role}' нет сообщений.", reply_markup=InlineKeyboardMarkup(kb))
         return MAIL_ALL_ROLES
 
-    context.user_data["mail_all_chosen_role"] = chosen_role
     kb = []
     for (m_id, rec, subj, bod, st, att, test_id) in relevant:
         preview = f"{subj} | {bod[:20]}..."
@@ -498,25 +521,39 @@ async def mail_all_choose_role(update: Update, context: ContextTypes.DEFAULT_TYP
             InlineKeyboardButton(preview, callback_data=f"mail_all_view:{m_id}"),
             InlineKeyboardButton("🗑 Удалить", callback_data=f"mail_all_del:{m_id}")
         ])
+    nav = page_nav_row("mail_all_page", relevant, has_newer, has_older)
+    if nav:
+        kb.append(nav)
     kb.append([InlineKeyboardButton("🔙 Назад", callback_data="mail_all")])
     await query.edit_message_text(f"Письма для роли '{chosen_role}':", reply_markup=InlineKeyboardMarkup(kb))
     return MAIL_ALL_LIST
 
+async def mail_all_choose_role(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    _, chosen_role = query.data.split(":", 1)
+    context.user_data["mail_all_chosen_role"] = chosen_role
+    context.user_data.pop("mail_all_page", None)
+    return await show_mail_all_list(query, context, chosen_role)
+
+async def mail_all_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Листание писем роли: callback_data "mail_all_page:<newer|older>:<id>"."""
+    query = update.callback_query
+    await query.answer()
+    context.user_data["mail_all_page"] = parse_page_data(query.data)
+    chosen_role = context.user_data.get("mail_all_chosen_role", NO_ROLE)
+    return await show_mail_all_list(query, context, chosen_role)
+
 async def mail_all_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     _, mail_id_str = query.data.split(":", 1)
     mail_id = int(mail_id_str)
-    all_list = get_all_emails()
-    found = None
-    for (m_id, rec, s, b, st, a, t_id) in all_list:
-        if m_id == mail_id:
-            found = (s, b, a, t_id)
-            break
-    if not found:
+    mail = await get_email_by_id(mail_id)
+    if not mail:
         await query.edit_message_text("Сообщение не найдено.")
         return MAIL_ALL_LIST
-    subj, bod, att, test_id = found
+    _, _, subj, bod, _, att, test_id = mail
     text = f"📧 Тема: {subj}\n\n{bod}"
     kb = [
         [InlineKeyboardButton("🗑 Удалить", callback_data=f"mail_all_del:{mail_id}")],
@@ -530,7 +567,7 @@ async def mail_all_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     _, mail_id_str = query.data.split(":", 1)
     mail_id = int(mail_id_str)
-    delete_email(mail_id)
+    await delete_email(mail_id)
     kb = [
         [InlineKeyboardButton("🔄 Обновить", callback_data="mail_all_refresh")],
         [InlineKeyboardButton("🔙 Назад", callback_data="mail_all_back")]
@@ -541,32 +578,8 @@ async def mail_all_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def mail_all_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    chosen_role = context.user_data.get("mail_all_chosen_role", "Без роли")
-    all_list = get_all_emails()
-    relevant = []
-    for (m_id, rec, s, b, st, a, t_id) in all_list:
-        info = get_user_by_id(rec)
-        if info:
-            if info[2] == chosen_role:
-                relevant.append((m_id, rec, s, b, st, a, t_id))
-        else:
-            if chosen_role == "Без роли":
-                relevant.append((m_id, rec, s, b, st, a, t_id))
-    if not relevant:
-        kb = [[InlineKeyboardButton("🔙 Назад", callback_data="mail_all")]]
-        await query.edit_message_text(f"У роли '{chosen_role}' нет сообщений.", reply_markup=InlineKeyboardMarkup(kb))
-        return MAIL_ALL_ROLES
-
-    kb = []
-    for (m_id, rec, subj, bod, st, att, test_id) in relevant:
-        preview = f"{subj} | {bod[:20]}..."
-        kb.append([
-            InlineKeyboardButton(preview, callback_data=f"mail_all_view:{m_id}"),
-            InlineKeyboardButton("🗑 Удалить", callback_data=f"mail_all_del:{m_id}")
-        ])
-    kb.append([InlineKeyboardButton("🔙 Назад", callback_data="mail_all")])
-    await query.edit_message_text(f"Письма для роли '{chosen_role}':", reply_markup=InlineKeyboardMarkup(kb))
-    return MAIL_ALL_LIST
+    chosen_role = context.user_data.get("mail_all_chosen_role", NO_ROLE)
+    return await show_mail_all_list(query, context, chosen_role)
 
 async def mail_all_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -578,7 +591,7 @@ async def mail_all_refresh(update: Update, context: ContextTypes.DEFAULT_TYPE):
 ########################################
 
 async def start_mail_sending_group(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
-    if not is_admin_or_dev(query):
+    if not await is_admin_or_dev(query):
         await safe_edit_menu(query, "Нет прав!")
         return MAIL_MENU
     for k in ["mail_group_role", "mail_group_subject", "mail_group_body", "mail_group_attachment", "mail_group_test_id"]:
@@ -632,7 +645,7 @@ async def mail_group_body_handler(update: Update, context: ContextTypes.DEFAULT_
 async def mail_group_attach_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    tests = get_all_tests()
+    tests = await get_all_tests()
     kb = []
     if tests:
         for (tid, header, link, fg, rl, uid, attach_id) in tests:
@@ -694,10 +707,9 @@ async def mail_group_show_preview(update_or_query, context: ContextTypes.DEFAULT
     test_id = context.user_data.get("mail_group_test_id", None)
     text_caption = f"💬 Сообщение группе: {role_name}\nТема: {subj}\n\n{bod}"
     if test_id:
-        for (tid, header, link, fg, rl, uid, attach_id) in get_all_tests():
-            if tid == test_id:
-                text_caption += f"\n\n📝 Прикреплён тест:\n«{header}»\n🔗 {link}"
-                break
+        test = await get_test_by_id(test_id)
+        if test:
+            text_caption += f"\n\n📝 Прикреплён тест:\n«{test[1]}»\n🔗 {test[2]}"
     kb = [
     [InlineKeyboardButton("✅ Отправить!", callback_data="mail_group_send")],
     [InlineKeyboardButton("🔙 Назад", callback_data="mail_main")]
@@ -718,22 +730,13 @@ async def mail_group_send_final(update: Update, context: ContextTypes.DEFAULT_TY
     att = context.user_data.get("mail_group_attachment", None)
     test_id = context.user_data.get("mail_group_test_id", None)
 
-    all_u = get_all_users()
-    if role_name == "ALL":
-        for (tid, nm, un, rl) in all_u:
-            insert_email(tid, subj, bod, att, test_id)
-            try:
-                await context.bot.send_message(tid, text=f"💬 Новое сообщение!\nТема: {subj}")
-            except:
-                pass
-    else:
-        for (tid, nm, un, rl) in all_u:
-            if rl == role_name:
-                insert_email(tid, subj, bod, att, test_id)
-                try:
-                    await context.bot.send_message(tid, text=f"💬 Новое сообщение!\nТема: {subj}")
-                except:
-                    pass
+    recipients = await get_user_ids_by_role(None if role_name == "ALL" else role_name)
+    await insert_emails_bulk(recipients, subj, bod, att, test_id)
+    for tid in recipients:
+        try:
+            await context.bot.send_message(tid, text=f"💬 Новое сообщение!\nТема: {subj}")
+        except:
+            pass
     for k in ["mail_group_role", "mail_group_subject", "mail_group_body", "mail_group_attachment", "mail_group_test_id"]:
         context.user_data.pop(k, None)
     await safe_edit_menu(query, f"✅ Сообщение успешно отправлено группе: {role_name}!")
@@ -759,13 +762,13 @@ async def mail_group_body_back(update: Update, context: ContextTypes.DEFAULT_TYP
 ########################################
 
 async def start_mail_sending_one(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE):
-    if not is_admin_or_dev(query):
+    if not await is_admin_or_dev(query):
         await safe_edit_menu(query, "Нет прав!")
         return MAIL_MENU
     for k in ["mail_one_recipient", "mail_one_subject", "mail_one_body", "mail_one_attachment", "mail_one_test_id"]:
         context.user_data.pop(k, None)
 
-    usrs = get_all_users()
+    usrs = await get_all_users()
     kb = []
     for (tid, nm, un, rl) in usrs:
         if tid == query.from_user.id:
@@ -819,7 +822,7 @@ async def mail_one_body_handler(update: Update, context: ContextTypes.DEFAULT_TY
 async def mail_one_attach_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    tests = get_all_tests()
+    tests = await get_all_tests()
     kb = []
     if tests:
         for (tid, header, link, fg, role, uid, attach_id) in tests:
@@ -877,10 +880,9 @@ async def mail_one_show_preview(update_or_query, context: ContextTypes.DEFAULT_T
     test_id = context.user_data.get("mail_one_test_id", None)
     text_caption = f"👤 Получатель: {rid}\n💬 Тема: {subj}\n\n{bod}"
     if test_id:
-        for (tid, header, link, fg, rl, uid, attach_id) in get_all_tests():
-            if tid == test_id:
-                text_caption += f"\n\n📝 Прикреплён тест:\n«{header}»\n🔗 {link}"
-                break
+        test = await get_test_by_id(test_id)
+        if test:
+            text_caption += f"\n\n📝 Прикреплён тест:\n«{test[1]}»\n🔗 {test[2]}"
     kb = [
     [InlineKeyboardButton("✅ Отправить!", callback_data="mail_one_send")],
     [InlineKeyboardButton("🔙 Назад", callback_data="mail_main")]
@@ -900,7 +902,7 @@ async def mail_one_send_final(update: Update, context: ContextTypes.DEFAULT_TYPE
     bod = context.user_data.get("mail_one_body", "")
     att = context.user_data.get("mail_one_attachment", None)
     test_id = context.user_data.get("mail_one_test_id", None)
-    insert_email(rid, subj, bod, att, test_id)
+    await insert_email(rid, subj, bod, att, test_id)
     try:
         await context.bot.send_message(chat_id=rid, text=f"💬 Новое сообщение!\nТема: {subj}")
     except:
@@ -932,22 +934,15 @@ async def show_tests_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
-    role = (get_role(user_id) or "").lower()
+    role = (await get_role(user_id) or "").lower()
     dev_name = (query.from_user.username or "").lower()
     can_admin = (role in ("администратор", "помощник директора")) or (dev_name == DEVELOPER_USERNAME.lower())
 
     if can_admin:
-        tests = get_all_tests()
+        tests = await get_all_tests()
     else:
-        # Для обычных пользователей: получаем все письма, где есть привязанный тест
-        emails_unread = get_unread_emails(user_id)
-        emails_read = get_read_emails(user_id)
-        test_ids = set()
-        for mail in emails_unread + emails_read:
-            # mail: (id, subject, body, attachment, test_id)
-            if mail[4]:
-                test_ids.add(mail[4])
-        tests = [test for test in get_all_tests() if test[0] in test_ids]
+        # Для обычных пользователей: тесты, привязанные к их письмам
+        tests = await get_tests_by_ids(await get_user_test_ids(user_id))
 
     kb = []
     if tests:
@@ -966,19 +961,14 @@ async def test_view_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     _, test_id_str = query.data.split(":", 1)
     test_id = int(test_id_str)
-    all_t = get_all_tests()
-    found = None
-    for (tid, header, link, fg, rl, uid, attach_id) in all_t:
-        if tid == test_id:
-            found = (header, link, attach_id)
-            break
-    if not found:
+    test = await get_test_by_id(test_id)
+    if not test:
         await query.edit_message_text("🚫 Тест не найден.")
         return TEST_MENU
-    header, link, attach_id = found
+    _, header, link, _, _, _, attach_id = test
     text = f"📝 Тест: {header}\n🔗 Ссылка: {link}"
     kb = [[InlineKeyboardButton("Открыть тест", url=link)]]
-    if is_admin_or_dev(query):
+    if await is_admin_or_dev(query):
         kb.append([InlineKeyboardButton("🗑 Удалить тест", callback_data=f"test_delete:{test_id}")])
     kb.append([InlineKeyboardButton("Назад", callback_data="mail_main")])
     await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb))
@@ -987,14 +977,12 @@ async def test_view_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def test_delete_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    if not is_admin_or_dev(query):
+    if not await is_admin_or_dev(query):
         await query.answer("Нет прав!", show_alert=True)
         return TEST_MENU
     _, tid_str = query.data.split(":", 1)
     test_id = int(tid_str)
-    from db import cursor, conn
-    cursor.execute("DELETE FROM tests WHERE id=?", (test_id,))
-    conn.commit()
+    await delete_test(test_id)
     await query.edit_message_text(f"🗑 Тест {test_id} удалён.")
     return await show_tests_menu(update, context)
 
@@ -1038,7 +1026,7 @@ async def test_create_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["test_for_group"] = False
     context.user_data["test_role"] = None
     context.user_data["test_user_id"] = None
-    allu = get_all_users()
+    allu = await get_all_users()
     kb = []
     for (tid, nm, un, rl) in allu:
         kb.append([InlineKeyboardButton(f"{nm} (@{un}) - {rl}", callback_data=f"test_usr:{tid}")])
@@ -1096,20 +1084,16 @@ async def test_create_confirm_handler(update: Update, context: ContextTypes.DEFA
         is_group = context.user_data.pop("test_for_group", False)
         role = context.user_data.pop("test_role", None)
         user_id = context.user_data.pop("test_user_id", None)
-        insert_test(header, link, is_group, role, user_id)
+        new_id = await insert_test(header, link, is_group, role, user_id)
 
         # Если нужно, рассылаем уведомления
-        new_all = get_all_tests()
-        new_id = max(t[0] for t in new_all) if new_all else 1
 
         subj = f"Новый тест: {header}"
         bod = f"Вам назначен тест «{header}». Отметьте письмо прочитанным, чтобы получить ссылку."
         if is_group and role:
-            for (tid, nm, un, rl) in get_all_users():
-                if rl and rl.lower() == role.lower():
-                    insert_email(tid, subj, bod, None, new_id)
+            await insert_emails_for_role(role, subj, bod, None, new_id)
         elif not is_group and user_id:
-            insert_email(user_id, subj, bod, None, new_id)
+            await insert_email(user_id, subj, bod, None, new_id)
 
         await query.edit_message_text(f"Тест «{header}» создан!")
         return await show_tests_menu(update, context)
@@ -1132,6 +1116,8 @@ mail_conv = ConversationHandler(
             CallbackQueryHandler(open_unread_mail_handler, pattern="^unread_mail:"),
             CallbackQueryHandler(mark_read_handler, pattern="^mark_read:"),
             CallbackQueryHandler(back_unread_handler, pattern="^back_unread$"),
+            CallbackQueryHandler(unread_page_handler, pattern="^unread_page:"),
+            CallbackQueryHandler(read_page_handler, pattern="^read_page:"),
             CallbackQueryHandler(open_read_mail_handler, pattern="^read_mail:"),
             CallbackQueryHandler(back_read_handler, pattern="^back_read$")
         ],
@@ -1139,12 +1125,14 @@ mail_conv = ConversationHandler(
         # «Все сообщения»
         MAIL_ALL_ROLES: [
             CallbackQueryHandler(mail_all_choose_role, pattern="^mail_all_group:"),
+            CallbackQueryHandler(mail_all_roles, pattern="^mail_all$"),
             CallbackQueryHandler(return_to_global_menu, pattern="^mail_main$")
         ],
         MAIL_ALL_LIST: [
             CallbackQueryHandler(mail_all_view, pattern="^mail_all_view:"),
             CallbackQueryHandler(mail_all_delete, pattern="^mail_all_del:"),
             CallbackQueryHandler(mail_all_back, pattern="^mail_all_back$"),
+            CallbackQueryHandler(mail_all_page_handler, pattern="^mail_all_page:"),
             CallbackQueryHandler(mail_all_refresh, pattern="^mail_all_refresh$"),
     # Добавляем обработчик для «Назад» (callback_data="mail_all"):
             CallbackQueryHandler(mail_all_roles, pattern="^mail_all$"),
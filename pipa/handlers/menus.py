@@ -3,7 +3,7 @@
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
-from db import get_role
+from db_async import get_role, get_unread_count
 from handlers.files import handle_files_obshaya, handle_files_role
 from handlers.search import start_search_callback
 from handlers.keyboards import get_admin_keyboard, get_user_keyboard
@@ -19,7 +19,7 @@ async def global_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
 
     user_id = query.from_user.id
-    role = get_role(user_id) or ""
+    role = await get_role(user_id) or ""
     role_lower = role.lower()
     is_admin_or_pom = (role_lower in ("администратор", "помощник директора"))
 
@@ -33,12 +33,13 @@ async def global_menu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
         from handlers.mail.mail_other import mail_command
         return await mail_command(update, context)
     elif data == "main_menu":
+        unread = await get_unread_count(user_id)
         if is_admin_or_pom:
             text = f"Главное меню (Админ / Помощник директора): {role}"
-            markup = get_admin_keyboard()
+            markup = get_admin_keyboard(unread)
         else:
             text = f"Главное меню (Пользователь): {role}"
-            markup = get_user_keyboard(role)
+            markup = get_user_keyboard(role, unread)
         await query.edit_message_text(text, reply_markup=markup)
         return
     else:
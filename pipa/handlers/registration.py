@@ -10,7 +10,7 @@ from telegram.ext import (
     ContextTypes
 )
 from config import ROLE_PASSWORDS, ROLES
-from db import create_user, get_user_by_id
+from db_async import create_user, get_user_by_id, get_unread_count
 from handlers.keyboards import get_admin_keyboard, get_user_keyboard
 
 logger = logging.getLogger(__name__)
@@ -26,11 +26,11 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     2) Иначе предлагаем выбрать роль из списка.
     """
     user_id = update.effective_user.id
-    user_info = get_user_by_id(user_id)
+    user_info = await get_user_by_id(user_id)
     if user_info:
         # Пользователь уже зарегистрирован — показываем меню
         role = user_info[2] or ""
-        await show_main_menu(update, role)
+        await show_main_menu(update, role, await get_unread_count(user_id))
         return ConversationHandler.END
     else:
         # Предлагаем выбрать роль
@@ -96,30 +96,31 @@ async def password_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     username = update.effective_user.username or ""
     full_name = update.effective_user.full_name or "Noname"
-    create_user(user_id, full_name, username, chosen_role)
+    await create_user(user_id, full_name, username, chosen_role)
 
     # Показываем главное меню в зависимости от роли
+    unread = await get_unread_count(user_id)
     is_admin_or_pom = (chosen_role.lower() in ("администратор", "помощник директора"))
     if is_admin_or_pom:
-        markup = get_admin_keyboard()
+        markup = get_admin_keyboard(unread)
         text = f"Пароль верный! Роль «{chosen_role}» установлена (админ-меню)."
     else:
-        markup = get_user_keyboard(chosen_role)
+        markup = get_user_keyboard(chosen_role, unread)
         text = f"Пароль верный! Роль «{chosen_role}» установлена."
     await update.message.reply_text(text, reply_markup=markup)
     return ConversationHandler.END
 
-async def show_main_menu(update: Update, role: str):
+async def show_main_menu(update: Update, role: str, unread: int = 0):
     """
     Показываем главное меню, если пользователь уже зарегистрирован.
     """
     is_admin_or_pom = (role.lower() in ("администратор", "помощник директора"))
     if is_admin_or_pom:
         text = f"Вы уже зарегистрированы как {role}. Админ-меню:"
-        markup = get_admin_keyboard()
+        markup = get_admin_keyboard(unread)
     else:
         text = f"Вы уже зарегистрированы как {role}. Меню пользователя:"
-        markup = get_user_keyboard(role)
+        markup = get_user_keyboard(role, unread)
     await update.message.reply_text(text, reply_markup=markup)
 
 async def cancel_registration(update: Update, context: ContextTypes.DEFAULT_TYPE):
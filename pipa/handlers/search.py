@@ -1,10 +1,12 @@
 # search.py
 
+import asyncio
+import heapq
 import logging
 import os
-import random
-import string
-from rapidfuzz import fuzz
+from collections import OrderedDict
+import numpy as np
+from rapidfuzz import fuzz, process
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ConversationHandler,
@@ -14,8 +16,14 @@ from telegram.ext import (
     ContextTypes,
     filters,
 )
-from config import BASE_DIR, OBSHAYA_DIR, DEVELOPER_USERNAME
-from db import get_role
+from config import (
+    BASE_DIR, OBSHAYA_DIR, DEVELOPER_USERNAME,
+    SEARCH_CACHE_SIZE, SEARCH_MAX_RESULTS, SEARCH_PAGE_SIZE
+)
+from db_async import get_role, get_unread_count
+import file_index
+import file_ids
+import doc_index
 from handlers.files import browse_directory
 from handlers.keyboards import get_admin_keyboard, get_user_keyboard
 from telegram.error import BadRequest
@@ -23,9 +31,14 @@ from telegram.error import BadRequest
 logger = logging.getLogger(__name__)
 
 SEARCH_STATE = 44
+# Сколько документов показывать из поиска по тексту
+DOC_SEARCH_LIMIT = 5
 
-def generate_id(length=6):
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=length))
+# Кэш результатов: (разделы, токены) → (версии индексов, results, total, doc_hits).
+# LRU на SEARCH_CACHE_SIZE запросов; запись устаревает, как только меняется
+# индекс имён или текста документов.
+_results_cache = OrderedDict()
+search_cache_stats = {"hits": 0, "misses": 0}
 
 async def safe_edit_message(query, new_text, reply_markup=None):
     try:
@@ -46,41 +59,134 @@ async def block_menu_while_search(update: Update, context: ContextTypes.DEFAULT_
 
 async def start_search_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    context.user_data["search_cache"] = {}
+    context.user_data.pop("search_cursor", None)
     await query.answer()
     await safe_edit_message(query, "🔎 Введите ключевые слова для поиска (через пробел):")
     return SEARCH_STATE
 
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data["search_cache"] = {}
+    context.user_data.pop("search_cursor", None)
     await update.message.reply_text("🔎 Введите ключевые слова для поиска (через пробел):")
     return SEARCH_STATE
 
-def match_all_tokens(filename_lower: str, tokens, threshold=75) -> float:
-    if not tokens:
-        return 0
-    total_score = 0
-    for token in tokens:
-        ratio_full = fuzz.ratio(token, filename_lower)
-        ratio_part = fuzz.partial_ratio(token, filename_lower)
-        best = max(ratio_full, ratio_part)
-        if best < threshold:
-            return 0
-        total_score += best
-    return total_score / len(tokens)
+def score_all_tokens(names_lower, tokens, threshold=75):
+    """
+    Оценивает сразу все имена против всех токенов.
+
+    Для каждого токена берётся лучшая из оценок fuzz.ratio и fuzz.partial_ratio;
+    имя проходит, только если каждый токен набрал не меньше threshold, а итог —
+    среднее по токенам. Возвращает массив оценок (0 — имя не подходит).
+    Сравнение идёт в rapidfuzz.process.cdist на всех ядрах.
+    """
+    if not tokens or not names_lower:
+        return np.zeros(len(names_lower))
+    full = process.cdist(tokens, names_lower, scorer=fuzz.ratio, dtype=np.float32, workers=-1)
+    part = process.cdist(tokens, names_lower, scorer=fuzz.partial_ratio, dtype=np.float32, workers=-1)
+    best = np.maximum(full, part)
+    passed = (best >= threshold).all(axis=0)
+    return np.where(passed, best.mean(axis=0), 0)
+
+async def run_search(tokens, scope):
+    """
+    Ищет по именам и по тексту документов в разделах scope (None — везде).
+    По именам возвращаются только SEARCH_MAX_RESULTS лучших, по убыванию
+    оценки, и общее число совпадений. Повторный запрос с теми же словами
+    отдаётся из кэша, пока индексы не изменились.
+    Возвращает (results, total, doc_hits).
+    """
+    key = (tuple(scope) if scope is not None else None, tuple(sorted(tokens)))
+    gen = (file_index.generation(), doc_index.generation())
+    cached = _results_cache.get(key)
+    if cached and cached[0] == gen:
+        _results_cache.move_to_end(key)
+        search_cache_stats["hits"] += 1
+        return cached[1:]
+    search_cache_stats["misses"] += 1
+
+    entries, names = file_index.search_view(scope)
+    scores = await asyncio.to_thread(score_all_tokens, names, tokens, 75)
+    matched = np.flatnonzero(scores)
+    # Держим в памяти только K лучших, а не все совпадения
+    top = heapq.nlargest(SEARCH_MAX_RESULTS, matched, key=scores.__getitem__)
+    results = []
+    for i in top:
+        kind, rel_path, name, _ = entries[i]
+        results.append((kind, float(scores[i]), rel_path, name))
+
+    # Поиск по тексту документов (FTS5)
+    doc_hits = await doc_index.search(tokens, scope, DOC_SEARCH_LIMIT)
+
+    _results_cache[key] = (gen, results, len(matched), doc_hits)
+    _results_cache.move_to_end(key)
+    while len(_results_cache) > SEARCH_CACHE_SIZE:
+        _results_cache.popitem(last=False)
+    return results, len(matched), doc_hits
+
+def render_results_page(results, total, doc_hits, page: int):
+    """
+    Собирает страницу результатов: (text, markup, items, page). items — то,
+    на что ссылаются кнопки страницы: searchfile|N / searchdir|N → items[N];
+    page — номер страницы после приведения к допустимому диапазону.
+    Документы, найденные по тексту, показываются на первой странице.
+    """
+    pages = max(1, -(-len(results) // SEARCH_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    start = page * SEARCH_PAGE_SIZE
+    items = []
+    keyboard = []
+    for (kind, score, rel_path, name) in results[start:start + SEARCH_PAGE_SIZE]:
+        n = len(items)
+        items.append((kind, rel_path, name))
+        scr_int = round(score)
+        if kind == "file":
+            label = f"📄 {name} (/{rel_path}) [{scr_int}]"
+            callback_data = f"searchfile|{n}"
+        else:
+            label = f"📁 {name} (/{rel_path}) [{scr_int}]"
+            callback_data = f"searchdir|{n}"
+        keyboard.append([InlineKeyboardButton(label, callback_data=callback_data)])
+
+    if results:
+        text = f"Результаты поиска: {start + 1}–{start + len(items)} из {total}"
+        if total > len(results):
+            text += f" (показаны {len(results)} лучших)"
+    else:
+        text = "Результаты поиска:"
+
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"search_page|{page - 1}"))
+    if page < pages - 1:
+        nav.append(InlineKeyboardButton("Далее ➡️", callback_data=f"search_page|{page + 1}"))
+    if nav:
+        keyboard.append(nav)
+
+    if doc_hits and page == 0:
+        lines = ["Найдено в тексте документов:"]
+        for n, (path, name, snippet) in enumerate(doc_hits, start=1):
+            rel_path = os.path.dirname(path) or "."
+            lines.append(f"{n}. {name} (/{rel_path})\n   {' '.join(snippet.split())}")
+            keyboard.append([InlineKeyboardButton(f"📝 {n}. {name}", callback_data=f"searchfile|{len(items)}")])
+            items.append(("file", rel_path, name))
+        text += "\n\n" + "\n".join(lines)
+
+    keyboard.append([InlineKeyboardButton("🔄 Новый поиск", callback_data="search_tryagain")])
+    keyboard.append([InlineKeyboardButton("🔙 Завершить поиск", callback_data="search_back")])
+    return text, InlineKeyboardMarkup(keyboard), items, page
 
 async def return_to_main_menu_after_search(query, context):
     user_id = query.from_user.id
-    role = get_role(user_id) or ""
+    role = await get_role(user_id) or ""
     dev_name = (query.from_user.username or "").lower()
     is_admin_or_pom = (role.lower() == "администратор" or role.lower() == "помощник директора" or dev_name == DEVELOPER_USERNAME.lower())
 
+    unread = await get_unread_count(user_id)
     if is_admin_or_pom:
         text = f"Поиск завершён. Возвращаемся в меню для роли: {role} (админ)."
-        markup = get_admin_keyboard()
+        markup = get_admin_keyboard(unread)
     else:
         text = f"Поиск завершён. Возвращаемся в меню для роли: {role}"
-        markup = get_user_keyboard(role)
+        markup = get_user_keyboard(role, unread)
     await safe_edit_message(query, text, markup)
 
 async def search_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -91,39 +197,25 @@ async def search_query_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         return SEARCH_STATE
 
     user_id = update.effective_user.id
-    role = get_role(user_id) or ""
+    role = await get_role(user_id) or ""
     dev_name = (update.effective_user.username or "").lower()
     is_admin = (role.lower() == "администратор" or dev_name == DEVELOPER_USERNAME.lower())
 
-    search_dirs = []
+    # Ищем по индексу имён (file_index), а не обходом диска на каждый запрос.
+    # Сотрудник видит только раздел своей роли и «Общую».
+    # Разделы индекса совпадают с верхними папками, поэтому тот же список
+    # годится и как префиксы путей для поиска по тексту документов.
     if is_admin:
-        search_dirs.append(BASE_DIR)
+        scope = None
     else:
-        role_dir = os.path.join(BASE_DIR, role)
-        if os.path.exists(role_dir):
-            search_dirs.append(role_dir)
-        if os.path.exists(OBSHAYA_DIR):
-            search_dirs.append(OBSHAYA_DIR)
+        scope = [os.path.relpath(OBSHAYA_DIR, BASE_DIR)]
+        if role:
+            scope.append(role)
 
-    results = []
-    for sd in search_dirs:
-        if not os.path.isdir(sd):
-            continue
-        for root, dirs, files in os.walk(sd):
-            for f in files:
-                name_lower = f.lower()
-                score = match_all_tokens(name_lower, tokens, threshold=75)
-                if score > 0:
-                    rel_path = os.path.relpath(root, BASE_DIR)
-                    results.append(("file", score, rel_path, f))
-            for d in dirs:
-                d_lower = d.lower()
-                score = match_all_tokens(d_lower, tokens, threshold=75)
-                if score > 0:
-                    rel_path = os.path.relpath(root, BASE_DIR)
-                    results.append(("dir", score, rel_path, d))
-
-    if not results:
+    results, total, doc_hits = await run_search(tokens, scope)
+
+    if not results and not doc_hits:
+        context.user_data.pop("search_cursor", None)
         keyboard = [
             [InlineKeyboardButton("🔄 Новый поиск", callback_data="search_tryagain")],
             [InlineKeyboardButton("🔙 Завершить поиск", callback_data="search_back")]
@@ -131,28 +223,43 @@ async def search_query_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("Ничего не найдено.", reply_markup=InlineKeyboardMarkup(keyboard))
         return SEARCH_STATE
     else:
-        results.sort(key=lambda x: x[1], reverse=True)
-        context.user_data["search_cache"] = {}
-        keyboard = []
-        for (kind, score, rel_path, name) in results:
-            uid = generate_id(6)
-            context.user_data["search_cache"][uid] = (kind, rel_path, name)
-            scr_int = round(score)
-            if kind == "file":
-                label = f"📄 {name} (/{rel_path}) [{scr_int}]"
-                callback_data = f"searchfile|{uid}"
-            else:
-                label = f"📁 {name} (/{rel_path}) [{scr_int}]"
-                callback_data = f"searchdir|{uid}"
-            keyboard.append([InlineKeyboardButton(label, callback_data=callback_data)])
-        keyboard.append([InlineKeyboardButton("🔄 Новый поиск", callback_data="search_tryagain")])
-        keyboard.append([InlineKeyboardButton("🔙 Завершить поиск", callback_data="search_back")])
-        await update.message.reply_text("Результаты поиска:", reply_markup=InlineKeyboardMarkup(keyboard))
+        text, markup, items, _ = render_results_page(results, total, doc_hits, 0)
+        # Вместо всех совпадений храним «курсор»: запрос, страницу и её кнопки
+        context.user_data["search_cursor"] = {"tokens": tokens, "scope": scope, "page": 0, "items": items}
+        await update.message.reply_text(text, reply_markup=markup)
+        return SEARCH_STATE
+
+async def search_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    cursor = context.user_data.get("search_cursor")
+    if not cursor:
+        await query.answer("Старая кнопка!", show_alert=True)
+        return SEARCH_STATE
+    try:
+        page = int(query.data.split("|", 1)[1])
+    except (IndexError, ValueError):
+        await query.answer("Ошибка страницы.", show_alert=True)
         return SEARCH_STATE
+    await query.answer()
+    results, total, doc_hits = await run_search(cursor["tokens"], cursor["scope"])
+    text, markup, items, page = render_results_page(results, total, doc_hits, page)
+    cursor["page"] = page
+    cursor["items"] = items
+    await safe_edit_message(query, text, markup)
+    return SEARCH_STATE
+
+def _cursor_item(context, data: str):
+    cursor = context.user_data.get("search_cursor") or {}
+    items = cursor.get("items", [])
+    try:
+        n = int(data.split("|", 1)[1])
+    except (IndexError, ValueError):
+        return None
+    return items[n] if 0 <= n < len(items) else None
 
 async def search_tryagain_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    context.user_data["search_cache"] = {}
+    context.user_data.pop("search_cursor", None)
     await query.answer()
     await safe_edit_message(query, "🔎 Введите ключевые слова для поиска (через пробел):")
     return SEARCH_STATE
@@ -166,13 +273,7 @@ async def search_back_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def searchfile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    try:
-        _, uid = query.data.split("|", 1)
-    except ValueError:
-        await query.answer("Ошибка в данных файла.", show_alert=True)
-        return SEARCH_STATE
-    cache = context.user_data.get("search_cache", {})
-    result = cache.get(uid)
+    result = _cursor_item(context, query.data)
     if not result:
         await query.answer("Старая кнопка!", show_alert=True)
         return SEARCH_STATE
@@ -186,27 +287,24 @@ async def searchfile_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.answer("Файл не найден!", show_alert=True)
         return SEARCH_STATE
     try:
-        with open(full_path, "rb") as f:
-            await context.bot.send_document(chat_id=query.message.chat.id, document=f, filename=filename)
+        await file_ids.send_cached_document(context.bot, query.message.chat.id, os.path.join(rel_path, filename))
     except Exception as e:
         logger.error(f"Ошибка при отправке файла {full_path}: {e}")
         await query.answer("Ошибка при отправке файла", show_alert=True)
         return SEARCH_STATE
 
-    keyboard = [[InlineKeyboardButton("🔙 Завершить поиск", callback_data="search_back")]]
+    page = context.user_data.get("search_cursor", {}).get("page", 0)
+    keyboard = [
+        [InlineKeyboardButton("⬅️ К результатам", callback_data=f"search_page|{page}")],
+        [InlineKeyboardButton("🔙 Завершить поиск", callback_data="search_back")]
+    ]
     await safe_edit_message(query, "Файл отправлен.", InlineKeyboardMarkup(keyboard))
     return SEARCH_STATE
 
 async def searchdir_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    try:
-        _, uid = query.data.split("|", 1)
-    except ValueError:
-        await query.answer("Ошибка в данных директории.", show_alert=True)
-        return SEARCH_STATE
-    cache = context.user_data.get("search_cache", {})
-    result = cache.get(uid)
+    result = _cursor_item(context, query.data)
     if not result:
         await query.answer("Старая кнопка!", show_alert=True)
         return SEARCH_STATE
@@ -217,7 +315,7 @@ async def searchdir_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     new_rel = os.path.join(rel_path, dirname)
     user_id = query.from_user.id
-    role = get_role(user_id) or ""
+    role = await get_role(user_id) or ""
     dev_name = (query.from_user.username or "").lower()
     is_admin = (role.lower() == "администратор" or dev_name == DEVELOPER_USERNAME.lower())
     allowed_root = "Администратор" if is_admin else role
@@ -241,6 +339,7 @@ search_conv = ConversationHandler(
         SEARCH_STATE: [
             MessageHandler(filters.TEXT & ~filters.COMMAND, search_query_handler),
             CallbackQueryHandler(search_tryagain_callback, pattern="^search_tryagain$"),
+            CallbackQueryHandler(search_page_handler, pattern="^search_page\\|"),
             CallbackQueryHandler(searchfile_handler, pattern="^searchfile\\|"),
             CallbackQueryHandler(searchdir_handler, pattern="^searchdir\\|"),
             CallbackQueryHandler(search_back_handler, pattern="^search_back$"),
@@ -0,0 +1,83 @@
+# jobs.py
+
+"""
+Периодические задачи бота (JobQueue).
+"""
+
+import asyncio
+import logging
+import os
+from telegram.ext import ContextTypes
+
+import db_async
+import doc_index
+import doc_text
+import dir_listing
+import file_index
+import fs_watch
+from handlers.admin import notify_role_about_file
+from paths import get_top_role_folder
+from config import MAIL_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+async def db_maintenance_job(context: ContextTypes.DEFAULT_TYPE):
+    """Архивирует старые прочитанные письма и обслуживает файл БД."""
+    try:
+        if MAIL_RETENTION_DAYS > 0:
+            moved = await db_async.archive_read_emails(MAIL_RETENTION_DAYS)
+            if moved:
+                logger.info(f"В архив перенесено писем: {moved}")
+        stats = await db_async.run_maintenance()
+        logger.info(f"Обслуживание БД выполнено: {stats}")
+    except Exception as e:
+        logger.error(f"Ошибка обслуживания БД: {e}")
+
+
+async def index_rescan_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обходит BASE_DIR в рабочем потоке и догоняет индексы поиска: имена
+    файлов (file_index) и затем текст изменившихся документов (doc_index).
+    """
+    try:
+        await asyncio.to_thread(file_index.rescan)
+        stats = await asyncio.to_thread(doc_index.sync)
+        if stats.get("indexed") or stats.get("removed"):
+            logger.info(f"Полнотекстовый индекс обновлён: {stats}")
+    except Exception as e:
+        logger.error(f"Ошибка обновления индексов поиска: {e}")
+
+
+async def fs_watch_job(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Разбирает события наблюдателя (fs_watch): обновляет индексы поиска и
+    оповещает роль о новых файлах, появившихся в её папке мимо бота.
+    """
+    removed, added, created = fs_watch.drain()
+    if not (removed or added):
+        return
+    try:
+        # Новым считаем только файл, которого ещё не было в индексе: пересохранение
+        # документа в Word тоже даёт «создание», но оповещать о нём не нужно.
+        new_files = [
+            p for p in created
+            if not file_index.contains(p)
+            and not fs_watch.is_own_write(p)
+            and not fs_watch.is_temp_name(os.path.basename(p))
+        ]
+        # Удаление или перенос папки даёт событие на каждый вложенный файл —
+        # применяем всё одной пачкой (вложенные пути file_index отбрасывает)
+        await file_index.note_removed_many(removed)
+        await file_index.note_added_many(added)
+        dir_listing.invalidate_many(removed + added)
+
+        for p in new_files:
+            role = get_top_role_folder(p)
+            if role and file_index.contains(p):
+                await notify_role_about_file(role, os.path.basename(p))
+
+        if any(doc_text.supported(p.lower()) for p in removed + added):
+            await asyncio.to_thread(doc_index.sync)
+    except Exception as e:
+        logger.error(f"Ошибка обработки изменений в папках: {e}")
@@ -0,0 +1,42 @@
+# paths.py
+
+"""
+Общие функции для путей внутри BASE_DIR (относительно неё).
+"""
+
+from config import ROLES
+
+
+def get_top_role_folder(rel_path: str) -> str|None:
+    """
+    Возвращает имя роли, если «верхняя папка» из rel_path совпадает с одним из ROLES (без учёта регистра).
+    Игнорирует начальные "./" или ".\".
+
+    Пример:
+      rel_path = "./Помощник директора/папка1"
+      → вернёт "Помощник директора", если в ROLES есть "Помощник директора"
+    """
+    if not rel_path or rel_path == ".":
+        return None
+
+    # Удаляем ведущие "./" или ".\":
+    if rel_path.startswith("./") or rel_path.startswith(".\\"):
+        rel_path = rel_path[2:]  # отрезаем два символа
+
+    # Нормализуем слэши
+    rel_path = rel_path.replace("\\", "/").strip().lstrip("/")
+    if not rel_path:
+        return None
+
+    # Первый сегмент
+    parts = rel_path.split("/")
+    top = parts[0].strip()
+
+    # Сравниваем без учёта регистра и лишних пробелов
+    top_lower = top.lower()
+
+    for r in ROLES:  # ROLES из config.py
+        if r.lower() == top_lower:
+            return r
+
+    return None
@@ -14,12 +14,20 @@ except ImportError:
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
-    CallbackQueryHandler
+    CallbackQueryHandler,
+    InlineQueryHandler
 )
 
 # Импорт настроек
-from config import BOT_TOKEN, setup_directories, DEVELOPER_USERNAME
-from db import get_developer_id, get_role
+from config import (
+    BOT_TOKEN, setup_directories, DEVELOPER_USERNAME,
+    DB_MAINTENANCE_INTERVAL_HOURS, INDEX_RESCAN_INTERVAL_MINUTES, FS_WATCH,
+    FS_WATCH_RESCAN_INTERVAL_MINUTES
+)
+import db_async
+import file_index
+import fs_watch
+from db_async import get_developer_id, get_role
 
 # Импорт ConversationHandler’ов
 from handlers.registration import registration_conv   # /start (регистрация)
@@ -32,17 +40,24 @@ from handlers.files import (
     directory_handler,
     file_handler,
     files_back_handler,
+    dir_page_handler,
     handle_files_obshaya,
     handle_files_role
 )
 
+# Инлайн-поиск (@бот запрос)
+from handlers.inline import inline_search_handler
+
 # Глобальный обработчик меню
 from handlers.menus import global_menu_handler
 
+# Периодические задачи
+from jobs import db_maintenance_job, index_rescan_job, fs_watch_job
+
 
 async def help_command(update, context):
     user_id = update.effective_user.id
-    role = get_role(user_id) or ""
+    role = await get_role(user_id) or ""
     dev_name = (update.effective_user.username or "").lower()
     if role.lower() in ("администратор", "помощник директора") or dev_name == DEVELOPER_USERNAME.lower():
         text = (
@@ -63,7 +78,7 @@ async def help_command(update, context):
 
 
 async def notify_developer_startup(app):
-    dev_id = get_developer_id("zxcegorka4")
+    dev_id = await get_developer_id("zxcegorka4")
     if dev_id:
         try:
             await app.bot.send_message(chat_id=dev_id, text="Бот запущен! 🚀")
@@ -75,7 +90,7 @@ async def error_handler(update, context):
     import traceback
     err_text = ''.join(traceback.format_exception(None, context.error, context.error.__traceback__))
     logging.error("Ошибка: %s", err_text)
-    dev_id = get_developer_id("zxcegorka4")
+    dev_id = await get_developer_id("zxcegorka4")
     if dev_id:
         try:
             await context.bot.send_message(chat_id=dev_id, text=f"Ошибка:\n{err_text}")
@@ -90,6 +105,7 @@ async def main():
     )
 
     setup_directories()
+    file_index.start()
     app = ApplicationBuilder().token(BOT_TOKEN).build()
 
     # 1) ConversationHandler’ы приоритетом 0
@@ -103,23 +119,51 @@ async def main():
     app.add_handler(CallbackQueryHandler(directory_handler, pattern="^dir\\|"), 0)
     app.add_handler(CallbackQueryHandler(file_handler, pattern="^file\\|"), 0)
     app.add_handler(CallbackQueryHandler(files_back_handler, pattern="^files_back$"), 0)
+    app.add_handler(CallbackQueryHandler(dir_page_handler, pattern="^dir(page|sort)\\|"), 0)
     app.add_handler(CallbackQueryHandler(handle_files_obshaya, pattern="^files_obshaya$"), 0)
     app.add_handler(CallbackQueryHandler(handle_files_role, pattern="^files_role$"), 0)
 
     # 3) Глобальный CallbackQueryHandler – приоритет 1
     app.add_handler(CallbackQueryHandler(global_menu_handler), 1)
 
-    # 4) /help
+    # 4) /help и инлайн-поиск
     app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(InlineQueryHandler(inline_search_handler))
 
     # 5) Обработчик ошибок
     app.add_error_handler(error_handler)
 
+    # 6) Периодические задачи
+    if app.job_queue:
+        app.job_queue.run_repeating(
+            db_maintenance_job,
+            interval=DB_MAINTENANCE_INTERVAL_HOURS * 3600,
+            first=600,
+            name="db_maintenance"
+        )
+        rescan_minutes = INDEX_RESCAN_INTERVAL_MINUTES
+        if FS_WATCH and fs_watch.start():
+            # Изменения приходят от наблюдателя; редкий обход остаётся как
+            # страховка: догоняет то, что поменялось, пока бот был выключен,
+            # и правки, о которых наблюдатель не узнал, и чистит индекс.
+            app.job_queue.run_repeating(fs_watch_job, interval=1, first=1, name="fs_watch")
+            rescan_minutes = max(rescan_minutes, FS_WATCH_RESCAN_INTERVAL_MINUTES)
+        app.job_queue.run_repeating(
+            index_rescan_job,
+            interval=rescan_minutes * 60,
+            first=60,
+            name="index_rescan"
+        )
+    else:
+        logging.warning("JobQueue недоступен (нужен python-telegram-bot[job-queue]) — обслуживание БД и обход файлов отключены.")
+
     # Уведомляем разработчика
     await notify_developer_startup(app)
 
     logging.info("Запуск бота...")
     await app.run_polling()
+    fs_watch.stop()
+    db_async.shutdown()
     logging.info("Бот остановлен.")
 
 
@@ -0,0 +1,75 @@
+# short_ids.py
+
+"""
+Короткие ID путей для callback_data кнопок (Telegram ограничивает её 64 байтами).
+
+ID — хэш пути (blake2b), поэтому у одного и того же пути он всегда один и
+тот же: повторный показ папки ничего нового не запоминает, а кнопки в
+старых сообщениях работают и после перезапуска бота. Недавние пути
+пользователя лежат в ограниченном LRU в user_data; ID, которого там нет,
+ищется по индексу файлов (file_index).
+"""
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+
+import file_index
+from config import SHORT_IDS_PER_USER
+
+# Обратная таблица ID -> путь по всему индексу, строится при первом промахе
+_by_id = {}
+_by_id_gen = -1
+
+
+def short_id(rel_path: str) -> str:
+    rel_path = os.path.normpath(rel_path)
+    return hashlib.blake2b(rel_path.encode("utf-8"), digest_size=6).hexdigest()
+
+
+def make(context, rel_path: str) -> str:
+    """Возвращает ID пути (от BASE_DIR) и запоминает его в LRU пользователя."""
+    rel_path = os.path.normpath(rel_path)
+    sid = short_id(rel_path)
+    ids = context.user_data.get("short_ids")
+    if ids is None:
+        ids = context.user_data["short_ids"] = OrderedDict()
+    if sid in ids:
+        ids.move_to_end(sid)
+    else:
+        ids[sid] = rel_path
+        if len(ids) > SHORT_IDS_PER_USER:
+            ids.popitem(last=False)
+    return sid
+
+
+def _build():
+    return {short_id(p): p for p in file_index.all_paths()}
+
+
+def _within(path: str, roots) -> bool:
+    return roots is None or any(path == r or path.startswith(r + os.sep) for r in roots)
+
+
+async def resolve(context, sid: str, roots=None) -> str | None:
+    """
+    Возвращает путь по ID или None, если такого пути больше нет.
+    roots — верхние папки, доступные пользователю (None — без ограничений):
+    путь вне их не возвращается, даже если ID угадан.
+    """
+    global _by_id, _by_id_gen
+    ids = context.user_data.get("short_ids")
+    if ids and sid in ids:
+        ids.move_to_end(sid)
+        path = ids[sid]
+        return path if _within(path, roots) else None
+    gen = file_index.generation()
+    if sid not in _by_id and gen != _by_id_gen:
+        _by_id = await asyncio.to_thread(_build)
+        _by_id_gen = gen
+    path = _by_id.get(sid)
+    if not path or not _within(path, roots):
+        return None
+    make(context, path)
+    return path